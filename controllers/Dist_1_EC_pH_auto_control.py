@@ -114,9 +114,11 @@ def safe_read_once():
       (ec, ph, temp) as floats, or (None, None, None) if read fails.
     """
     try:
-        ph_raw = dev.read_register(0x00, 2, functioncode=3)
-        ec_raw = dev.read_register(0x01, 2, functioncode=3) / 10.0
-        temp_raw = dev.read_register(0x02, 2, functioncode=3) * 10.0
+        # One request for registers 0x00..0x02 (raw ints; decimals=2 -> /100)
+        regs = dev.read_registers(0x00, 3, functioncode=3)
+        ph_raw = regs[0] / 100.0
+        ec_raw = regs[1] / 100.0 / 10.0
+        temp_raw = regs[2] / 100.0 * 10.0
         return float(ec_raw), float(ph_raw), float(temp_raw)
     except Exception:
         return None, None, None
@@ -130,7 +132,10 @@ def average_ec_ph_temp():
       ("FAIL", None, None, None) on sensor read failure
       ("STOP", None, None, None) if switch turned OFF
     """
-    ec_list, ph_list, temp_list = [], [], []
+    # Running sums: same left-to-right result as sum(list)/len(list),
+    # without keeping per-sample float objects around.
+    sum_ec = sum_ph = sum_temp = 0.0
+    n = 0
     start = time.monotonic()
     next_tick = start
 
@@ -141,9 +146,10 @@ def average_ec_ph_temp():
 
         ec, ph, temp = safe_read_once()
         if ec is not None and ph is not None and temp is not None:
-            ec_list.append(ec)
-            ph_list.append(ph)
-            temp_list.append(temp)
+            sum_ec += ec
+            sum_ph += ph
+            sum_temp += temp
+            n += 1
 
         if time.monotonic() - start >= DURATION_SEC:
             break
@@ -151,12 +157,12 @@ def average_ec_ph_temp():
         next_tick += INTERVAL_SEC
         time.sleep(max(0, next_tick - time.monotonic()))
 
-    if not ec_list or not ph_list or not temp_list:
+    if n == 0:
         return "FAIL", None, None, None
 
-    avg_ec = round(sum(ec_list) / len(ec_list), 2)
-    avg_ph = round(sum(ph_list) / len(ph_list), 2)
-    avg_temp = round(sum(temp_list) / len(temp_list), 2)
+    avg_ec = round(sum_ec / n, 2)
+    avg_ph = round(sum_ph / n, 2)
+    avg_temp = round(sum_temp / n, 2)
 
     return "OK", avg_ec, avg_ph, avg_temp
 
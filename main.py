@@ -15,7 +15,6 @@ import subprocess
 import json
 import csv
 import os
-import threading
 import time
 from datetime import datetime
 
@@ -63,9 +62,12 @@ def run_python_script(path):
         return None, f"Exception: {e}"
 
 def ensure_solution_log():
-    """Make sure solution log CSV exists with header."""
-    os.makedirs(os.path.dirname(SOLUTION_LOG_CSV), exist_ok=True)
-    need_header = (not os.path.exists(SOLUTION_LOG_CSV)) or (os.path.getsize(SOLUTION_LOG_CSV) == 0)
+    """Make sure solution log CSV exists with header (called once at startup)."""
+    try:
+        need_header = os.stat(SOLUTION_LOG_CSV).st_size == 0
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(SOLUTION_LOG_CSV), exist_ok=True)
+        need_header = True
     if need_header:
         with open(SOLUTION_LOG_CSV, "a", newline="") as f:
             w = csv.writer(f)
@@ -73,22 +75,11 @@ def ensure_solution_log():
 
 def log_solution(solution_name, volume_ml):
     """Append one line to solution log CSV."""
-    ensure_solution_log()
     ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     with open(SOLUTION_LOG_CSV, "a", newline="") as f:
         w = csv.writer(f)
         w.writerow([ts, solution_name, volume_ml])
 
-# ------------ Pump control (blocking) ------------
-
-def run_pump_blocking(duration_sec):
-    """Turn pump ON for duration_sec seconds (blocking)."""
-    GPIO.output(PIN_PUMP, GPIO.LOW)
-    try:
-        time.sleep(max(0.0, duration_sec))
-    finally:
-        GPIO.output(PIN_PUMP, GPIO.HIGH)
-
 # ------------ Tkinter App ------------
 
 class App(tk.Tk):
@@ -113,6 +104,10 @@ class App(tk.Tk):
         self.sol_acid_ml = tk.StringVar(value="")
         self.last_inject_label = tk.StringVar(value="Last injection: -")
 
+        # Pump OFF is scheduled on the Tk event loop (no worker thread)
+        self._pump_until = 0.0
+        self._pump_off_job = None
+
         self._build_ui()
 
         # Start periodic sensor updates
@@ -307,9 +302,25 @@ class App(tk.Tk):
         ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.last_inject_label.set(f"Last injection: {ts} ({sol_name} {ml:.1f} ml)")
 
-        # Run pump in background thread
-        th = threading.Thread(target=run_pump_blocking, args=(duration_sec,), daemon=True)
-        th.start()
+        self.run_pump(duration_sec)
+
+    # ---------- Pump control (Tk event loop) ----------
+
+    def run_pump(self, duration_sec):
+        """Turn pump ON and schedule OFF after duration_sec (non-blocking)."""
+        now = time.monotonic()
+        self._pump_until = max(self._pump_until, now + max(0.0, duration_sec))
+        GPIO.output(PIN_PUMP, GPIO.LOW)
+
+        if self._pump_off_job is not None:
+            self.after_cancel(self._pump_off_job)
+        delay_ms = int((self._pump_until - now) * 1000)
+        self._pump_off_job = self.after(delay_ms, self._pump_off)
+
+    def _pump_off(self):
+        self._pump_off_job = None
+        self._pump_until = 0.0
+        GPIO.output(PIN_PUMP, GPIO.HIGH)
 
     # ---------- Logs tab ----------
 
@@ -330,6 +341,9 @@ class App(tk.Tk):
 
     def on_close(self):
         try:
+            if self._pump_off_job is not None:
+                self.after_cancel(self._pump_off_job)
+                self._pump_off()
             GPIO.cleanup()
         except Exception:
             pass
@@ -337,6 +351,7 @@ class App(tk.Tk):
 
 
 def main():
+    ensure_solution_log()
     app = App()
     app.protocol("WM_DELETE_WINDOW", app.on_close)
     app.mainloop()
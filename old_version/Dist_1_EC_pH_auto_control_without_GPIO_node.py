@@ -105,8 +105,11 @@ def force_pumps_off():
 # ===============================
 def ensure_csv_ready_sensor(path: str):
     """Create directory and write header for sensor CSV if missing/empty."""
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    need_header = (not os.path.exists(path)) or (os.path.getsize(path) == 0)
+    try:
+        need_header = os.stat(path).st_size == 0
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        need_header = True
     if need_header:
         with open(path, mode="a", newline="") as f:
             writer = csv.writer(f)
@@ -114,8 +117,11 @@ def ensure_csv_ready_sensor(path: str):
 
 def ensure_csv_ready_inject(path: str):
     """Create directory and write header for injection CSV if missing/empty."""
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    need_header = (not os.path.exists(path)) or (os.path.getsize(path) == 0)
+    try:
+        need_header = os.stat(path).st_size == 0
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        need_header = True
     if need_header:
         with open(path, mode="a", newline="") as f:
             # Keep the same style header as your Node-RED file node
@@ -136,9 +142,11 @@ def safe_read_once():
       (ec, ph, temp) as floats, or (None, None, None) if read fails.
     """
     try:
-        ph_raw = dev.read_register(0x00, 2, functioncode=3)
-        ec_raw = dev.read_register(0x01, 2, functioncode=3) / 10.0
-        temp_raw = dev.read_register(0x02, 2, functioncode=3) * 10.0
+        # One request for registers 0x00..0x02 (raw ints; decimals=2 -> /100)
+        regs = dev.read_registers(0x00, 3, functioncode=3)
+        ph_raw = regs[0] / 100.0
+        ec_raw = regs[1] / 100.0 / 10.0
+        temp_raw = regs[2] / 100.0 * 10.0
         return float(ec_raw), float(ph_raw), float(temp_raw)
     except Exception:
         return None, None, None
@@ -184,13 +192,26 @@ def average_ec_ph_temp():
 
     return "OK", avg_ec, avg_ph, avg_temp
 
+# Long-lived O_DSYNC log handles (path -> file), opened on first use
+_dsync_logs = {}
+
+def dsync_log(path: str):
+    """
+    Return an append handle opened once with O_DSYNC.
+    Each line-buffered row is one write(2) that is durable on return,
+    so no per-row open/fsync/close is needed.
+    """
+    f = _dsync_logs.get(path)
+    if f is None:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_DSYNC, 0o644)
+        f = os.fdopen(fd, mode="a", newline="", buffering=1)
+        _dsync_logs[path] = f
+    return f
+
 def log_sensor(date_str, ec, ph, temp):
     """Append one sensor row to SENSOR_CSV."""
-    with open(SENSOR_CSV, mode="a", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([date_str, ec, ph, temp])
-        f.flush()
-        os.fsync(f.fileno())
+    writer = csv.writer(dsync_log(SENSOR_CSV))
+    writer.writerow([date_str, ec, ph, temp])
 
 def log_injection(device: str, ml: float, sec: float):
     """
@@ -201,10 +222,7 @@ def log_injection(device: str, ml: float, sec: float):
     ts = now_str(sec=True)
     sec_disp = round(sec, 1)
     line = f"{ts},{device},volume,{ml},duration,{sec_disp}s\n"
-    with open(INJECT_CSV, mode="a", newline="") as f:
-        f.write(line)
-        f.flush()
-        os.fsync(f.fileno())
+    dsync_log(INJECT_CSV).write(line)
 
 # ===============================
 # Pump control
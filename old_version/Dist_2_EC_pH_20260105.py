@@ -243,14 +243,14 @@
 # -*- coding: utf-8 -*-
 import os
 import csv
-import json
+import atexit
+import signal
 import time
-import datetime
 import serial
 import fcntl
 import re
 import sys
-from collections import deque
+from array import array
 from serial.serialutil import SerialException
 
 # ===============================
@@ -259,12 +259,14 @@ from serial.serialutil import SerialException
 PORT = "/dev/serial/by-id/usb-1a86_USB_Serial-if00-port0"
 BAUD = 115200
 REQ  = "node000300|SensorReq|8985"
+REQ_BYTES = REQ.encode("ascii", errors="ignore")  # encoded once
 
 ID_PH   = 16
 ID_TEMP = 29
 ID_EC   = 30
 
 CSV_PATH = "/home/cja/Work/cja-skyfarms-project/sensors/Dist_2_EC_pH_log.csv"
+CSV_FSYNC_EVERY = 10   # fsync once per N rows (and on exit), not per row
 
 TOTAL_TIMEOUT_SEC = 3.0
 IDLE_GAP_SEC = 0.2
@@ -304,21 +306,50 @@ def sleep_to_next_boundary(step_sec: int):
 # ===============================
 def ensure_csv_header(path: str):
     """Create directory and write header if file is missing/empty."""
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    if (not os.path.exists(path)) or (os.path.getsize(path) == 0):
+    try:
+        need_header = os.stat(path).st_size == 0
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        need_header = True
+    if need_header:
         with open(path, mode="a", newline="") as f:
             w = csv.writer(f)
             w.writerow(["Date", "EC", "pH", "Solution_Temperature"])
             f.flush()
             os.fsync(f.fileno())
 
-def append_csv_row(path: str, date_str: str, ec, ph, temp):
-    """Append one row and fsync for safety."""
-    with open(path, mode="a", newline="") as f:
-        w = csv.writer(f)
-        w.writerow([date_str, ec, ph, temp])
-        f.flush()
-        os.fsync(f.fileno())
+CSV_FH = None   # persistent, line-buffered handle (open_csv)
+CSV_W = None    # csv.writer over CSV_FH
+_csv_unsynced = 0
+
+def open_csv(path: str):
+    """Open the CSV once for the whole run; fsync + close at exit."""
+    global CSV_FH, CSV_W
+    CSV_FH = open(path, mode="a", newline="", buffering=1)
+    CSV_W = csv.writer(CSV_FH)
+    atexit.register(close_csv)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+def close_csv():
+    """Flush + fsync + close the CSV handle (idempotent)."""
+    global CSV_FH, CSV_W
+    if CSV_FH is None:
+        return
+    try:
+        CSV_FH.flush()
+        os.fsync(CSV_FH.fileno())
+    finally:
+        CSV_FH.close()
+        CSV_FH = CSV_W = None
+
+def append_csv_row(date_str: str, ec, ph, temp):
+    """Append one row (line-buffered write); fsync every CSV_FSYNC_EVERY rows."""
+    global _csv_unsynced
+    CSV_W.writerow([date_str, ec, ph, temp])
+    _csv_unsynced += 1
+    if _csv_unsynced >= CSV_FSYNC_EVERY:
+        os.fsync(CSV_FH.fileno())
+        _csv_unsynced = 0
 
 # ===============================
 # Serial helpers
@@ -327,36 +358,101 @@ def read_burst(ser, total_timeout=3.0, idle_gap=0.2) -> bytes:
     """Read bytes until idle gap after some data (no newline protocol)."""
     ser.timeout = 0.1
     buf = bytearray()
-    t0 = time.time()
+    timeout_ns = int(total_timeout * 1e9)
+    idle_gap_ns = int(idle_gap * 1e9)
+    t0 = time.monotonic_ns()
     last_rx = None
-    while time.time() - t0 < total_timeout:
+    while time.monotonic_ns() - t0 < timeout_ns:
         chunk = ser.read(256)
         if chunk:
             buf += chunk
-            last_rx = time.time()
+            last_rx = time.monotonic_ns()
         else:
-            if buf and last_rx and (time.time() - last_rx) > idle_gap:
+            if buf and last_rx and (time.monotonic_ns() - last_rx) > idle_gap_ns:
                 break
     return bytes(buf)
 
+# Control chars except \t \n \r
+_PAT_CTRL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
 def safe_decode(raw: bytes) -> str:
     """Decode even if bytes are broken; strip control chars."""
     raw = raw.replace(b"\x00", b"")
     text = raw.decode("utf-8", errors="replace")
-    text = re.sub(r"[\x00-\x08\x0b\x0c\x0e-\x1f]", "", text)
+    text = _PAT_CTRL.sub("", text)
     return text.strip()
 
+def _is_digit(c: str) -> bool:
+    """ASCII 0-9 only (str.isdigit also accepts e.g. superscripts)."""
+    return "0" <= c <= "9"
+
+def _leading_number(s: str, max_skip: int, allow_dot: bool, max_digits: int = 0):
+    """
+    Skip up to max_skip non-digits, then return the numeric prefix (or None).
+    max_digits > 0 rejects longer integer parts (the regex allows 1-4 id digits).
+    """
+    i = 0
+    n = len(s)
+    while i < n and i < max_skip and not _is_digit(s[i]):
+        i += 1
+    if i >= n or not _is_digit(s[i]):
+        return None
+    j = i
+    while j < n and _is_digit(s[j]):
+        j += 1
+    if max_digits and j - i > max_digits:
+        return None
+    if allow_dot and j + 1 < n and s[j] == "." and _is_digit(s[j + 1]):
+        j += 1
+        while j < n and _is_digit(s[j]):
+            j += 1
+    return s[i:j]
+
+def parse_values_fast(text: str):
+    """
+    Fast path for clean payloads: plain split/partition, no regex.
+    Every id chunk must have the shape _PAT_IDVAL accepts (<=12 / 1-4 digits /
+    <=40 non-digits / "value" / <=12 / number); on anything else return all
+    None so the regex fallback decides. Accepted frames give the same pairs
+    as the regex.
+    """
+    if not text.isascii():
+        return None, None, None
+    found = {}
+    for chunk in text.lower().split("id")[1:]:   # lower(): regex is IGNORECASE
+        sid = _leading_number(chunk, 12, allow_dot=False, max_digits=4)
+        if sid is None:
+            return None, None, None
+        # sid is the first digit run, so find() locates it; "value" must follow it
+        gap, sep, rest = chunk[chunk.find(sid) + len(sid):].partition("value")
+        if not sep or len(gap) > 40 or any(_is_digit(c) for c in gap):
+            return None, None, None
+        val = _leading_number(rest, 12, allow_dot=True)
+        if val is None:
+            return None, None, None
+        try:
+            found[int(sid)] = float(val)
+        except ValueError:
+            return None, None, None
+    return found.get(ID_EC), found.get(ID_PH), found.get(ID_TEMP)
+
+_PAT_IDVAL = re.compile(
+    r'id[^0-9]{0,12}(\d{1,4})[^0-9]{0,40}value[^0-9]{0,12}([0-9]+(?:\.[0-9]+)?)',
+    re.IGNORECASE
+)
+
 def parse_values_very_robust(text: str):
     """
     Extract id/value pairs from possibly corrupted payload.
     This is intentionally permissive; physical validation will protect us.
+    Clean payloads take the split-based fast path; regex is the fallback.
     """
-    pat = re.compile(
-        r'id[^0-9]{0,12}(\d{1,4})[^0-9]{0,40}value[^0-9]{0,12}([0-9]+(?:\.[0-9]+)?)',
-        re.IGNORECASE
-    )
+    ec, ph, tp = parse_values_fast(text)
+    if ec is not None and ph is not None and tp is not None:
+        return ec, ph, tp
+
     found = {}
-    for m in pat.finditer(text):
+    for m in _PAT_IDVAL.finditer(text):
         try:
             sid = int(m.group(1))
             val = float(m.group(2))
@@ -399,6 +495,23 @@ def within_eps(a, b, eps):
         return False
     return abs(a - b) <= eps
 
+# ===============================
+# Fixed-size ring buffers
+# ===============================
+def ring_push(bufs, idx, n, values):
+    """
+    Write one value into each same-sized buffer at idx (in place).
+    Returns the new (idx, n).
+    """
+    for buf, x in zip(bufs, values):
+        buf[idx] = x
+    size = len(bufs[0])
+    return (idx + 1) % size, min(n + 1, size)
+
+def json_num(x) -> str:
+    """JSON literal for an optional float (None -> null), same as json.dumps."""
+    return "null" if x is None else repr(x)
+
 # ===============================
 # One request (lock + retry)
 # ===============================
@@ -424,7 +537,7 @@ def request_once_with_lock_and_retry():
                     ser.reset_input_buffer()
                     ser.reset_output_buffer()
 
-                    ser.write(REQ.encode("ascii", errors="ignore"))
+                    ser.write(REQ_BYTES)
                     ser.flush()
 
                     raw = read_burst(ser, total_timeout=TOTAL_TIMEOUT_SEC, idle_gap=IDLE_GAP_SEC)
@@ -465,6 +578,7 @@ def request_once_with_lock_and_retry():
 # ===============================
 def main():
     ensure_csv_header(CSV_PATH)
+    open_csv(CSV_PATH)
 
     # Representative (accepted) values
     rep_ec = None
@@ -473,16 +587,19 @@ def main():
     last_err = None
 
     # Rolling windows for Hampel (only accepted reps feed these)
-    win_ec = deque(maxlen=HAMPEL_WINDOW)
-    win_ph = deque(maxlen=HAMPEL_WINDOW)
-    win_tp = deque(maxlen=HAMPEL_WINDOW)
+    # One contiguous float64 array per channel (SoA, no boxed floats stored)
+    win_ec = array("d", [0.0]) * HAMPEL_WINDOW
+    win_ph = array("d", [0.0]) * HAMPEL_WINDOW
+    win_tp = array("d", [0.0]) * HAMPEL_WINDOW
+    win_idx = win_n = 0
 
     # Candidate buffers for confirmation
-    cand_ec = deque(maxlen=CONFIRM_N)
-    cand_ph = deque(maxlen=CONFIRM_N)
-    cand_tp = deque(maxlen=CONFIRM_N)
+    cand_ec = array("d", [0.0]) * CONFIRM_N
+    cand_ph = array("d", [0.0]) * CONFIRM_N
+    cand_tp = array("d", [0.0]) * CONFIRM_N
+    cand_idx = cand_n = 0
 
-    last_report_minute = None
+    last_report_minute = None  # epoch minute (int) of the last report
 
     # Optional: stderr start log (won't break JSON node)
     print(f"[start] Dist_2 sensor loop on {PORT}, baud={BAUD}", file=sys.stderr, flush=True)
@@ -507,15 +624,13 @@ def main():
         tp = round(tp, 2)
 
         # 3) Hampel check (per-channel, using accepted window)
-        ec_out = hampel_is_outlier(ec, list(win_ec), HAMPEL_K)
-        ph_out = hampel_is_outlier(ph, list(win_ph), HAMPEL_K)
-        tp_out = hampel_is_outlier(tp, list(win_tp), HAMPEL_K)
+        ec_out = hampel_is_outlier(ec, win_ec[:win_n], HAMPEL_K)
+        ph_out = hampel_is_outlier(ph, win_ph[:win_n], HAMPEL_K)
+        tp_out = hampel_is_outlier(tp, win_tp[:win_n], HAMPEL_K)
 
         if ec_out or ph_out or tp_out:
             # 4) Confirmation path: require 2-of-3 repetition before accepting
-            cand_ec.append(ec)
-            cand_ph.append(ph)
-            cand_tp.append(tp)
+            cand_idx, cand_n = ring_push((cand_ec, cand_ph, cand_tp), cand_idx, cand_n, (ec, ph, tp))
 
             # Epsilons (tune)
             EC_EPS = 0.10
@@ -523,16 +638,16 @@ def main():
             TP_EPS = 1.00
 
             # Count how many in candidate buffer are close to the latest candidate
-            base_ec, base_ph, base_tp = cand_ec[-1], cand_ph[-1], cand_tp[-1]
-            ok_ec = sum(within_eps(v, base_ec, EC_EPS) for v in cand_ec)
-            ok_ph = sum(within_eps(v, base_ph, PH_EPS) for v in cand_ph)
-            ok_tp = sum(within_eps(v, base_tp, TP_EPS) for v in cand_tp)
+            base_ec, base_ph, base_tp = ec, ph, tp
+            ok_ec = sum(within_eps(v, base_ec, EC_EPS) for v in cand_ec[:cand_n])
+            ok_ph = sum(within_eps(v, base_ph, PH_EPS) for v in cand_ph[:cand_n])
+            ok_tp = sum(within_eps(v, base_tp, TP_EPS) for v in cand_tp[:cand_n])
 
             if ok_ec >= CONFIRM_M and ok_ph >= CONFIRM_M and ok_tp >= CONFIRM_M:
                 # Accept after confirmation
                 rep_ec, rep_ph, rep_tp = base_ec, base_ph, base_tp
-                win_ec.append(rep_ec); win_ph.append(rep_ph); win_tp.append(rep_tp)
-                cand_ec.clear(); cand_ph.clear(); cand_tp.clear()
+                win_idx, win_n = ring_push((win_ec, win_ph, win_tp), win_idx, win_n, (rep_ec, rep_ph, rep_tp))
+                cand_idx = cand_n = 0
             else:
                 # Not confirmed yet -> keep waiting
                 continue
@@ -540,30 +655,33 @@ def main():
         else:
             # Normal path: accept immediately
             rep_ec, rep_ph, rep_tp = ec, ph, tp
-            win_ec.append(rep_ec); win_ph.append(rep_ph); win_tp.append(rep_tp)
-            cand_ec.clear(); cand_ph.clear(); cand_tp.clear()
+            win_idx, win_n = ring_push((win_ec, win_ph, win_tp), win_idx, win_n, (rep_ec, rep_ph, rep_tp))
+            cand_idx = cand_n = 0
 
         # 5) Report & CSV save at interval (once per minute)
-        now = datetime.datetime.now()
-        minute_key = now.strftime("%Y-%m-%d %H:%M")
+        # Integer guard first; format the date only when a report fires
+        t = int(time.time())
+        epoch_min = t // 60
+        tm = time.localtime(t)
 
-        if (now.minute % REPORT_MINUTES == 0) and (last_report_minute != minute_key):
+        if (tm.tm_min % REPORT_MINUTES == 0) and (last_report_minute != epoch_min):
+            minute_key = time.strftime("%Y-%m-%d %H:%M", tm)
             if rep_ec is not None and rep_ph is not None and rep_tp is not None:
                 try:
-                    append_csv_row(CSV_PATH, minute_key, rep_ec, rep_ph, rep_tp)
+                    append_csv_row(minute_key, rep_ec, rep_ph, rep_tp)
                 except Exception as e:
                     # Do not write errors to CSV; log to stderr only
                     print(f"[csv_write_failed] {e}", file=sys.stderr, flush=True)
 
             # Only one-line JSON on stdout (safe for Node-RED json node)
-            print(json.dumps({
-                "date": minute_key,
-                "EC": rep_ec,
-                "pH": rep_ph,
-                "Solution_Temperature": rep_tp
-            }, ensure_ascii=False), flush=True)
-
-            last_report_minute = minute_key
+            # Fixed schema + our own strftime date (no quotes/backslashes) -> template
+            sys.stdout.write(
+                f'{{"date": "{minute_key}", "EC": {json_num(rep_ec)}, '
+                f'"pH": {json_num(rep_ph)}, "Solution_Temperature": {json_num(rep_tp)}}}\n'
+            )
+            sys.stdout.flush()
+
+            last_report_minute = epoch_min
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 import os
-import csv
+import sys
+import atexit
+import signal
 import json
 import time
-import datetime
 import serial
 import fcntl
+import select
 import re
 import math
+from bisect import bisect_left, insort
+from collections import deque
 from serial.serialutil import SerialException
 
 # ===============================
@@ -18,6 +22,7 @@ PORT = "/dev/serial/by-id/usb-1a86_USB_Serial-if00-port0"
 
 BAUD = 115200
 REQ  = "node000300|SensorReq|8985"
+REQ_BYTES = REQ.encode("ascii", errors="ignore")  # encoded once
 
 # Target sensor IDs (expected)
 ID_PH   = 16
@@ -50,6 +55,8 @@ VALID_TP_MIN, VALID_TP_MAX = 10.00, 50.00      # 
 # ===============================
 HAMPEL_WIN = 6          # 6 samples * 10s = 60s
 HAMPEL_K = 3.0
+# MAD -> sigma scale folded into the threshold once (k * 1.4826)
+_HAMPEL_THRESH = HAMPEL_K * 1.4826
 
 # ===============================
 # Confirmation settings
@@ -74,45 +81,124 @@ def sleep_to_next_boundary(step_sec: int):
 # ===============================
 def ensure_csv_header(path: str):
     """Create directory and write header if file is missing/empty."""
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    if (not os.path.exists(path)) or (os.path.getsize(path) == 0):
+    try:
+        need_header = os.stat(path).st_size == 0
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        need_header = True
+    if need_header:
         with open(path, mode="a", newline="") as f:
-            w = csv.writer(f)
-            w.writerow(["Date", "EC", "pH", "Solution_Temperature"])
+            f.write("Date,EC,pH,Solution_Temperature\r\n")
+
+# Kept open for the life of the daemon (see open_csv/close_csv)
+_csv_fh = None
+
+def open_csv(path: str):
+    """
+    Open the CSV once (line-buffered). Rows go to the page cache;
+    fsync happens only on shutdown (atexit, also reached via SIGTERM).
+    """
+    global _csv_fh
+    _csv_fh = open(path, mode="a", newline="", buffering=1)
+    atexit.register(close_csv)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+def close_csv():
+    """Flush + fsync + close the CSV handle (idempotent)."""
+    global _csv_fh
+    if _csv_fh is None:
+        return
+    try:
+        _csv_fh.flush()
+        os.fsync(_csv_fh.fileno())
+    finally:
+        _csv_fh.close()
+        _csv_fh = None
 
-def append_csv_row(path: str, date_str: str, ec, ph, temp):
-    """Append one row and fsync for safety."""
-    with open(path, mode="a", newline="") as f:
-        w = csv.writer(f)
-        w.writerow([date_str, ec, ph, temp])
-        f.flush()
-        os.fsync(f.fileno())
+def csv_cell(x) -> str:
+    """Blank for None, plain str() otherwise (numbers/date never need quoting)."""
+    return "" if x is None else str(x)
+
+def append_csv_row(date_str: str, ec, ph, temp):
+    """
+    Append one row to the open CSV (no per-row fsync).
+    Fixed 4-column numeric schema, so format directly instead of csv.writer
+    (same output as before: comma-separated, CRLF line ending).
+    """
+    _csv_fh.write(f"{date_str},{csv_cell(ec)},{csv_cell(ph)},{csv_cell(temp)}\r\n")
 
 # ===============================
 # Serial helpers
 # ===============================
+ser = None  # long-lived port handle (opened once, reopened on error)
+
+def open_serial():
+    """Open PORT once; ask the driver for low-latency mode when it supports it."""
+    port = serial.Serial(
+        PORT, baudrate=BAUD,
+        bytesize=serial.EIGHTBITS,
+        parity=serial.PARITY_NONE,
+        stopbits=serial.STOPBITS_ONE,
+        timeout=0.1
+    )
+    try:
+        port.set_low_latency_mode(True)   # ASYNC_LOW_LATENCY (setserial low_latency)
+    except Exception:
+        pass                              # not supported by every USB-serial driver
+    time.sleep(0.15)                      # settle after a fresh open only
+    return port
+
+def get_serial():
+    """Return the shared port handle, opening it on first use."""
+    global ser
+    if ser is None or not ser.is_open:
+        ser = open_serial()
+    return ser
+
+def reset_serial():
+    """Close current port handle; next get_serial() reopens it."""
+    global ser
+    old = ser
+    ser = None
+    if old is not None:
+        try:
+            old.close()
+        except:
+            pass
+
 def read_burst(ser, total_timeout=3.0, idle_gap=0.2) -> bytes:
-    """Read bytes until idle gap after some data (no newline protocol)."""
-    ser.timeout = 0.1
+    """
+    Read bytes until idle gap after some data (no newline protocol).
+    select() on the port fd wakes as soon as bytes arrive; whatever is
+    queued is drained with one os.read (no 0.1 s read-timeout polling).
+    """
+    fd = ser.fileno()
     buf = bytearray()
-    t0 = time.time()
-    last_rx = None
+    deadline = time.monotonic() + total_timeout
 
-    while time.time() - t0 < total_timeout:
-        chunk = ser.read(256)
-        if chunk:
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        r, _, _ = select.select([fd], [], [], min(idle_gap, remaining) if buf else remaining)
+        if r:
+            chunk = os.read(fd, max(ser.in_waiting, 1))
+            if not chunk:
+                raise SerialException("device reports readiness to read but returned no data")
             buf += chunk
-            last_rx = time.time()
-        else:
-            if buf and last_rx and (time.time() - last_rx) > idle_gap:
-                break
+        elif buf:
+            break   # idle gap after data
     return bytes(buf)
 
+# Control chars except \t \n \r
+_PAT_CTRL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_CTRL_BYTES = bytes(b for b in range(0x20) if b not in (0x09, 0x0a, 0x0d))  # same set, for bytes.translate
+
 def safe_decode(raw: bytes) -> str:
     """Decode even if bytes are broken; strip control chars."""
     raw = raw.replace(b"\x00", b"")
     text = raw.decode("utf-8", errors="replace")
-    text = re.sub(r"[\x00-\x08\x0b\x0c\x0e-\x1f]", "", text)
+    text = _PAT_CTRL.sub("", text)
     return text.strip()
 
 # ===============================
@@ -132,13 +218,15 @@ def fix_slash_number(s: str) -> str:
             return parts[0] + "." + parts[1]
     return s
 
+_PAT_NON_NUMERIC = re.compile(r"[^0-9\.\-]")
+
 def to_float_maybe(s: str):
     """Try to convert a corrupted numeric string to float."""
     if s is None:
         return None
     s2 = fix_slash_number(str(s))
     s2 = s2.replace(" ", "")
-    s2 = re.sub(r"[^0-9\.\-]", "", s2)
+    s2 = _PAT_NON_NUMERIC.sub("", s2)
     if not s2:
         return None
     try:
@@ -149,52 +237,49 @@ def to_float_maybe(s: str):
         return None
     return None
 
-def extract_value_for_id(text: str, target_id: int):
-    """
-    Try to extract the numeric value that follows a given id.
-    Works even if quotes/colons are partially corrupted, as long as 'id' + digits survive.
-    """
-    m = re.search(
-        r'(?:id)[^0-9]{0,10}' + re.escape(str(target_id)) + r'[^0-9]{0,100}',
-        text,
-        re.IGNORECASE
-    )
-    if not m:
-        return None
-
-    window = text[m.start(): m.start() + 260]
-
-    mv = re.search(r'(?:value)[^0-9]{0,30}([0-9]+(?:[./][0-9]+)?)', window, re.IGNORECASE)
-    if mv:
-        return to_float_maybe(mv.group(1))
+# One pass over the raw bytes: (id, value) pairs, tolerant to corrupted quotes/colons
+_PAT_IDVAL = re.compile(
+    rb'id[^0-9]{0,10}([0-9]{1,4})[^0-9]{0,100}value[^0-9]{0,30}([0-9]+(?:[./][0-9]+)?)',
+    re.IGNORECASE
+)
+_PAT_VALUE = re.compile(rb'value[^0-9]{0,30}([0-9]+(?:[./][0-9]+)?)', re.IGNORECASE)
 
-    mn = re.search(r'([0-9]+(?:[./][0-9]+)?)', window)
-    if mn:
-        return to_float_maybe(mn.group(1))
-
-    return None
-
-def parse_ec_ph_tp(text: str):
+def parse_ec_ph_tp(raw: bytes):
     """
-    Position-based parsing:
-    Extract the first 3 numeric 'value' fields in order.
-    Expected order in sensors[]:
+    Id-based parsing in a single regex pass over the raw bytes.
+    If any of EC/pH/Temp is missing, fill it by position:
+    the first 3 numeric 'value' fields in order are
       1) pH, 2) Solution_Temperature, 3) EC
     Return (ec, ph, tp) where each may be None.
     """
-    # Grab value tokens in order even if JSON is corrupted
+    raw = raw.translate(None, _CTRL_BYTES)  # stray control bytes would split numbers/keys
+
+    found = {}
+    for m in _PAT_IDVAL.finditer(raw):
+        v = to_float_maybe(m.group(2).decode("ascii"))
+        if v is not None:
+            found[int(m.group(1))] = v
+
+    ec, ph, tp = found.get(ID_EC), found.get(ID_PH), found.get(ID_TEMP)
+    if ec is not None and ph is not None and tp is not None:
+        return ec, ph, tp
+
+    # Grab value tokens in order even if ids are corrupted
     vals = []
-    for m in re.finditer(r'value[^0-9]{0,30}([0-9]+(?:[./][0-9]+)?)', text, re.IGNORECASE):
-        v = to_float_maybe(m.group(1))
+    for m in _PAT_VALUE.finditer(raw):
+        v = to_float_maybe(m.group(1).decode("ascii"))
         if v is not None:
             vals.append(v)
         if len(vals) >= 3:
             break
 
     # If we don't get 3 values, return whatever we have (partial)
-    ph = vals[0] if len(vals) >= 1 else None
-    tp = vals[1] if len(vals) >= 2 else None
-    ec = vals[2] if len(vals) >= 3 else None
+    if ph is None and len(vals) >= 1:
+        ph = vals[0]
+    if tp is None and len(vals) >= 2:
+        tp = vals[1]
+    if ec is None and len(vals) >= 3:
+        ec = vals[2]
     return ec, ph, tp
 
 # ===============================
@@ -202,7 +287,7 @@ def parse_ec_ph_tp(text: str):
 # ===============================
 def request_once_with_lock_and_retry():
     """
-    Lock bus -> open serial -> request once -> parse -> retry.
+    Lock bus -> request once on the shared port -> parse -> retry.
     Returns (ec, ph, tp, err_string_or_None, head_text).
     """
     lockf = open(SERIAL_LOCK_PATH, "w")
@@ -214,39 +299,33 @@ def request_once_with_lock_and_retry():
 
         for _ in range(RETRY_ATTEMPTS):
             try:
-                with serial.Serial(
-                    PORT, baudrate=BAUD,
-                    bytesize=serial.EIGHTBITS,
-                    parity=serial.PARITY_NONE,
-                    stopbits=serial.STOPBITS_ONE,
-                    timeout=0.1
-                ) as ser:
-                    time.sleep(0.15)
-                    ser.reset_input_buffer()
-                    ser.reset_output_buffer()
-
-                    ser.write(REQ.encode("ascii", errors="ignore"))
-                    ser.flush()
-
-                    raw = read_burst(ser, total_timeout=TOTAL_TIMEOUT_SEC, idle_gap=IDLE_GAP_SEC)
-                    if not raw:
-                        last_err = "no_data"
-                        time.sleep(RETRY_DELAY_SEC)
-                        continue
-
-                    text = safe_decode(raw)
-                    last_head = text[:180]
-
-                    ec, ph, tp = parse_ec_ph_tp(text)
-
-                    if ec is None and ph is None and tp is None:
-                        last_err = "value_missing_all"
-                        time.sleep(RETRY_DELAY_SEC)
-                        continue
-
-                    return ec, ph, tp, None, last_head
+                port = get_serial()
+                port.reset_input_buffer()
+                port.reset_output_buffer()
+
+                port.write(REQ_BYTES)
+                port.flush()
+
+                raw = read_burst(port, total_timeout=TOTAL_TIMEOUT_SEC, idle_gap=IDLE_GAP_SEC)
+                if not raw:
+                    last_err = "no_data"
+                    time.sleep(RETRY_DELAY_SEC)
+                    continue
+
+                last_head = safe_decode(raw[:180])
+
+                ec, ph, tp = parse_ec_ph_tp(raw)
+
+                if ec is None and ph is None and tp is None:
+                    last_err = "value_missing_all"
+                    time.sleep(RETRY_DELAY_SEC)
+                    continue
+
+                return ec, ph, tp, None, last_head
 
             except (SerialException, OSError) as e:
+                # USB/serial glitches often recover after reopening the port.
+                reset_serial()
                 last_err = f"serial_error: {e}"
                 time.sleep(RETRY_DELAY_SEC)
             except Exception as e:
@@ -293,36 +372,98 @@ def median(values):
         return s[mid]
     return 0.5 * (s[mid - 1] + s[mid])
 
-def mad(values, med):
-    """Median absolute deviation."""
-    dev = [abs(v - med) for v in values]
-    return median(dev)
+class RollingWindow:
+    """
+    Last `size` samples, kept in arrival order (deque) and sorted (bisect).
+    Sliding the window is one insort + one delete; no per-sample sort.
+    (median, MAD) is cached until the window changes, so a run of
+    rejected outliers reuses it.
+    """
 
-def hampel_accept(candidate, history, k=3.0, flat_abs_tol=0.2):
-    """Hampel decision (True = accept)."""
-    if not is_finite_number(candidate):
+    def __init__(self, size: int):
+        self.order = deque(maxlen=size)
+        self.sorted = []
+        self._stats = None
+
+    def __len__(self):
+        return len(self.order)
+
+    def append(self, x: float):
+        if len(self.order) == self.order.maxlen:
+            oldest = self.order[0]
+            del self.sorted[bisect_left(self.sorted, oldest)]
+        self.order.append(x)
+        insort(self.sorted, x)
+        self._stats = None
+
+    def stats(self):
+        """(median, MAD) of the current window (cached)."""
+        if self._stats is None:
+            m = self.median()
+            self._stats = (m, None if m is None else self.mad(m))
+        return self._stats
+
+    def accept(self, x: float) -> bool:
+        """Hampel-test x against the window; append it only if accepted."""
+        if hampel_accept(x, self):
+            self.append(x)
+            return True
         return False
-    c = float(candidate)
 
-    if len(history) < max(5, HAMPEL_WIN // 3):
-        return True
+    def median(self):
+        s = self.sorted
+        n = len(s)
+        if n == 0:
+            return None
+        mid = n // 2
+        if n % 2 == 1:
+            return s[mid]
+        return 0.5 * (s[mid - 1] + s[mid])
+
+    def mad(self, med):
+        """
+        Median absolute deviation without building/sorting a deviation list:
+        walk outwards from med on the sorted window (two-pointer merge).
+        """
+        s = self.sorted
+        n = len(s)
+        if n == 0:
+            return None
+        r = bisect_left(s, med)
+        l = r - 1
+        want_hi = n // 2
+        want_lo = want_hi if n % 2 == 1 else want_hi - 1
+        lo_v = cur = None
+        for i in range(want_hi + 1):
+            if l >= 0 and (r >= n or med - s[l] <= s[r] - med):
+                cur = med - s[l]
+                l -= 1
+            else:
+                cur = s[r] - med
+                r += 1
+            if i == want_lo:
+                lo_v = cur
+        if n % 2 == 1:
+            return cur
+        return 0.5 * (lo_v + cur)
+
+def hampel_accept(c, window, flat_abs_tol=0.2):
+    """Hampel decision on a RollingWindow (True = accept). c is already a float."""
+    if not is_finite_number(c):
+        return False
 
-    window = history[-HAMPEL_WIN:]
-    m = median(window)
-    if m is None:
+    if len(window) < max(5, HAMPEL_WIN // 3):
         return True
 
-    mad_v = mad(window, m)
-    if mad_v is None:
+    m, mad_v = window.stats()
+    if m is None or mad_v is None:
         return True
 
-    sigma = 1.4826 * mad_v
-
     # If history is flat (MAD=0), allow small absolute deviation instead of exact match
-    if sigma == 0:
-        return abs(c - m) <= float(flat_abs_tol)
+    if mad_v == 0:
+        return abs(c - m) <= flat_abs_tol
 
-    return abs(c - m) <= (k * sigma)
+    return abs(c - m) <= _HAMPEL_THRESH * mad_v
 
 def within_band(a, b, band_abs):
     """Check if two values are close enough."""
@@ -355,14 +496,36 @@ def confirmation_update(rep, pending_list, candidate, band_abs, n=3, m=2):
 
     return rep, pending_list, "pending"
 
+# One-line report (same text json.dumps(payload) produced; date is our own strftime)
+REPORT_FMT = ('{"type": "report", "date": "%s", "EC": %s, "pH": %s, '
+              '"Solution_Temperature": %s, "last_err": %s%s}\n')
+REPORT_NOTE_NOT_READY = ', "note": "rep_not_ready"'
+
+def json_num2(x) -> str:
+    """JSON literal for an optional float rounded to 2 decimals (None -> null)."""
+    return "null" if x is None else repr(round(x, 2))
+
+def update_channel(x, hist, rep, pend, band_abs):
+    """
+    One channel's full decision (Hampel -> confirmation) in one call.
+    x is an already-validated float. Returns (rep, pend, accepted).
+    """
+    if not hist.accept(x):
+        return rep, pend, False
+    rep, pend, _ = confirmation_update(rep, pend, x, band_abs, CONFIRM_N, CONFIRM_M)
+    return rep, pend, True
+
 # ===============================
 # Main loop
 # ===============================
 def main():
     ensure_csv_header(CSV_PATH)
+    open_csv(CSV_PATH)
 
-    # Histories for Hampel (accepted samples only)
-    hist_ec, hist_ph, hist_tp = [], [], []
+    # Histories for Hampel (accepted samples only, last HAMPEL_WIN)
+    hist_ec = RollingWindow(HAMPEL_WIN)
+    hist_ph = RollingWindow(HAMPEL_WIN)
+    hist_tp = RollingWindow(HAMPEL_WIN)
 
     # Representatives (confirmed) - updated per-variable independently
     rep_ec = rep_ph = rep_tp = None
@@ -370,8 +533,8 @@ def main():
     # Pending for confirmation
     pend_ec, pend_ph, pend_tp = [], [], []
 
-    last_json_minute = None
-    last_csv_minute = None
+    last_json_minute = None  # epoch minute (int) of the last JSON report
+    last_csv_minute = None   # epoch minute (int) of the last CSV row
     last_err = None
 
     # Start message (Node-RED liveness)
@@ -396,22 +559,16 @@ def main():
 
             # EC
             if valid_ec(ec):
-                ec = float(ec)
-                if hampel_accept(ec, hist_ec, HAMPEL_K):
-                    hist_ec.append(ec)
-                    hist_ec = hist_ec[-(HAMPEL_WIN * 3):]
-                    rep_ec, pend_ec, _ = confirmation_update(rep_ec, pend_ec, ec, EC_BAND_ABS, CONFIRM_N, CONFIRM_M)
+                rep_ec, pend_ec, ok = update_channel(float(ec), hist_ec, rep_ec, pend_ec, EC_BAND_ABS)
+                if ok:
                     updated_any = True
                 else:
                     last_err = "hampel_outlier_ec"
 
             # pH (allow missing/invalid, do NOT block others)
             if valid_ph(ph):
-                ph = float(ph)
-                if hampel_accept(ph, hist_ph, HAMPEL_K):
-                    hist_ph.append(ph)
-                    hist_ph = hist_ph[-(HAMPEL_WIN * 3):]
-                    rep_ph, pend_ph, _ = confirmation_update(rep_ph, pend_ph, ph, PH_BAND_ABS, CONFIRM_N, CONFIRM_M)
+                rep_ph, pend_ph, ok = update_channel(float(ph), hist_ph, rep_ph, pend_ph, PH_BAND_ABS)
+                if ok:
                     updated_any = True
                 else:
                     last_err = "hampel_outlier_ph"
@@ -422,11 +579,8 @@ def main():
 
             # Temp
             if valid_tp(tp):
-                tp = float(tp)
-                if hampel_accept(tp, hist_tp, HAMPEL_K):
-                    hist_tp.append(tp)
-                    hist_tp = hist_tp[-(HAMPEL_WIN * 3):]
-                    rep_tp, pend_tp, _ = confirmation_update(rep_tp, pend_tp, tp, TP_BAND_ABS, CONFIRM_N, CONFIRM_M)
+                rep_tp, pend_tp, ok = update_channel(float(tp), hist_tp, rep_tp, pend_tp, TP_BAND_ABS)
+                if ok:
                     updated_any = True
                 else:
                     last_err = "hampel_outlier_tp"
@@ -435,34 +589,38 @@ def main():
                 # If we got at least one good update, clear stale error
                 last_err = None
 
-        now = datetime.datetime.now()
-        minute_key = now.strftime("%Y-%m-%d %H:%M")
+        # Integer guards first; format the date only when a branch fires
+        t = int(time.time())
+        epoch_min = t // 60
+        tm = time.localtime(t)
+        minute_key = None
 
         # 2) JSON output every 3 minutes (exactly once per minute)
-        if (now.minute % JSON_EVERY_MIN == 0) and (last_json_minute != minute_key):
-            payload = {
-                "type": "report",
-                "date": minute_key,
-                "EC": (round(rep_ec, 2) if rep_ec is not None else None),
-                "pH": (round(rep_ph, 2) if rep_ph is not None else None),
-                "Solution_Temperature": (round(rep_tp, 2) if rep_tp is not None else None),
-                "last_err": last_err
-            }
-            if payload["EC"] is None and payload["pH"] is None and payload["Solution_Temperature"] is None:
-                payload["note"] = "rep_not_ready"
-            print(json.dumps(payload, ensure_ascii=False), flush=True)
-            last_json_minute = minute_key
+        if (tm.tm_min % JSON_EVERY_MIN == 0) and (last_json_minute != epoch_min):
+            minute_key = time.strftime("%Y-%m-%d %H:%M", tm)
+            # Fixed schema -> template; only last_err (free text) goes through the JSON encoder
+            not_ready = rep_ec is None and rep_ph is None and rep_tp is None
+            sys.stdout.write(REPORT_FMT % (
+                minute_key,
+                json_num2(rep_ec), json_num2(rep_ph), json_num2(rep_tp),
+                json.dumps(last_err, ensure_ascii=False),
+                REPORT_NOTE_NOT_READY if not_ready else "",
+            ))
+            sys.stdout.flush()
+            last_json_minute = epoch_min
 
         # 3) CSV save every 20 minutes (exactly once per minute)
         # Policy: Save if EC + Temp exist; pH may be blank.
-        if (now.minute % CSV_EVERY_MIN == 0) and (last_csv_minute != minute_key):
+        if (tm.tm_min % CSV_EVERY_MIN == 0) and (last_csv_minute != epoch_min):
+            if minute_key is None:
+                minute_key = time.strftime("%Y-%m-%d %H:%M", tm)
             if rep_ec is not None and rep_tp is not None:
                 try:
                     log_ec = round(float(rep_ec), 2)
                     log_tp = round(float(rep_tp), 2)
                     log_ph = round(float(rep_ph), 2) if rep_ph is not None else ""
 
-                    append_csv_row(CSV_PATH, minute_key, log_ec, log_ph, log_tp)
+                    append_csv_row(minute_key, log_ec, log_ph, log_tp)
 
                 except Exception as e:
                     print(json.dumps({
@@ -480,7 +638,7 @@ def main():
                     "Solution_Temperature": (round(rep_tp, 2) if rep_tp is not None else None)
                 }, ensure_ascii=False), flush=True)
 
-            last_csv_minute = minute_key
+            last_csv_minute = epoch_min
 
 
 if __name__ == "__main__":
@@ -2,7 +2,6 @@
 import os
 import json
 import time
-import datetime
 import sqlite3
 import fcntl
 
@@ -35,15 +34,15 @@ def sleep_to_next_boundary(step_sec: int):
     next_t = (int(now) // step_sec + 1) * step_sec
     time.sleep(max(0, next_t - now))
 
-def minute_key(dt: datetime.datetime) -> str:
+def minute_key(tm: time.struct_time) -> str:
     """YYYY-MM-DD HH:MM"""
-    return dt.strftime("%Y-%m-%d %H:%M")
+    # Fixed format -> plain f-string (no C strftime / locale path)
+    return f"{tm.tm_year:04d}-{tm.tm_mon:02d}-{tm.tm_mday:02d} {tm.tm_hour:02d}:{tm.tm_min:02d}"
 
-def slot_key_for(dt: datetime.datetime, step_min: int) -> str:
-    """Floor dt to the slot boundary minute (e.g., 20-min slots)."""
-    slot_min = (dt.minute // step_min) * step_min
-    slot_dt = dt.replace(minute=slot_min, second=0, microsecond=0)
-    return slot_dt.strftime("%Y-%m-%d %H:%M")
+def slot_key_for(tm: time.struct_time, step_min: int) -> str:
+    """Floor tm to the slot boundary minute (e.g., 20-min slots)."""
+    slot_min = (tm.tm_min // step_min) * step_min
+    return f"{tm.tm_year:04d}-{tm.tm_mon:02d}-{tm.tm_mday:02d} {tm.tm_hour:02d}:{slot_min:02d}"
 
 # ===============================
 # Modbus init
@@ -76,37 +75,49 @@ def reset_instrument():
 # ===============================
 # SQLite helpers
 # ===============================
+db = None  # long-lived connection (PRAGMAs set once on open)
+
+def get_db(db_path: str):
+    """Open the SQLite connection on first use and reuse it afterwards."""
+    global db
+    if db is None:
+        db = sqlite3.connect(db_path, timeout=5.0)
+        db.execute("PRAGMA journal_mode=WAL;")
+        db.execute("PRAGMA synchronous=NORMAL;")
+    return db
+
 def insert_dist1(db_path: str, table: str, date_str: str, ec, ph, temp):
     """Insert one row into SQLite."""
-    conn = sqlite3.connect(db_path, timeout=5.0)
+    conn = get_db(db_path)
     try:
-        conn.execute("PRAGMA journal_mode=WAL;")
-        conn.execute("PRAGMA synchronous=NORMAL;")
         conn.execute(
             f'INSERT INTO "{table}" ("Date","EC","pH","Solution_Temperature") VALUES (?,?,?,?);',
             (date_str, ec, ph, temp)
         )
         conn.commit()
-    finally:
-        conn.close()
+    except Exception:
+        conn.rollback()
+        raise
 
 # ===============================
 # Read once
 # ===============================
 def read_once():
     """
-    Read all three once.
+    Read all three once (one Modbus request for registers 0x00..0x02).
     - pH: decimals=2
     - EC: /10
     - Solution_Temperature: *10 (as your current spec)
+    read_registers() returns raw ints, so decimals=2 (/100) is applied here.
     """
     global dev
     if dev is None:
         dev = build_instrument()
 
-    ph = dev.read_register(0x00, 2, functioncode=3)
-    ec = dev.read_register(0x01, 2, functioncode=3) / 10.0
-    tp = dev.read_register(0x02, 2, functioncode=3) * 10.0
+    regs = dev.read_registers(0x00, 3, functioncode=3)
+    ph = regs[0] / 100.0
+    ec = regs[1] / 100.0 / 10.0
+    tp = regs[2] / 100.0 * 10.0
     return round(ec, 2), round(ph, 2), round(tp, 2)
 
 def acquire_lock_with_timeout(lockf, timeout_sec: float) -> bool:
@@ -161,7 +172,7 @@ def main():
     latest_ok_ts = None  # epoch seconds of last successful read
     consecutive_sensor_fail = 0
 
-    last_saved_slot = None  # "YYYY-MM-DD HH:MM" at 00/20/40
+    last_saved_bucket = None  # epoch // (SAVE_EVERY_MIN*60) of last insert
 
     # Optional started message
     print(json.dumps({
@@ -190,9 +201,9 @@ def main():
                 f"unknown_read_error (consecutive_fail={consecutive_sensor_fail})"
             )
 
-        now = datetime.datetime.now()
-        mkey = minute_key(now)
         now_ts = time.time()
+        tm = time.localtime(now_ts)
+        mkey = minute_key(tm)
         latest_age_sec = None if latest_ok_ts is None else round(now_ts - latest_ok_ts, 1)
 
         out = {
@@ -213,12 +224,13 @@ def main():
         }
 
         # 2) DB save every 20 minutes at boundary minute (00/20/40), once per slot
-        if now.minute % SAVE_EVERY_MIN == 0:
+        if tm.tm_min % SAVE_EVERY_MIN == 0:
             out["save"]["should"] = True
-            skey = slot_key_for(now, SAVE_EVERY_MIN)   # floor to boundary
+            skey = slot_key_for(tm, SAVE_EVERY_MIN)   # floor to boundary
             out["save"]["slot"] = skey
 
-            if last_saved_slot != skey:
+            bucket = int(now_ts) // (SAVE_EVERY_MIN * 60)
+            if last_saved_bucket != bucket:
                 if latest_ec is None or latest_ph is None or latest_tp is None:
                     out["errors"]["db"] = "skip_save: latest values are None"
                 elif latest_ok_ts is None:
@@ -233,7 +245,7 @@ def main():
                     else:
                         try:
                             insert_dist1(DB_PATH, DB_TABLE, skey, latest_ec, latest_ph, latest_tp)
-                            last_saved_slot = skey
+                            last_saved_bucket = bucket
                             out["save"]["did"] = True
                         except Exception as e:
                             out["errors"]["db"] = f"db_write_failed: {e}"
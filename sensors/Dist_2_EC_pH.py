@@ -1,26 +1,35 @@
 # -*- coding: utf-8 -*-
 import os
+import sys
 import json
 import time
-import datetime
 import serial
 import fcntl
-import sqlite3
+import select
 import re
+import sqlite3
 import math
 from serial.serialutil import SerialException
 
+try:
+    import orjson  # optional, faster JSON encode/decode
+except ImportError:
+    orjson = None
+
 # ===============================
 # Settings
 # ===============================
 PORT = "/dev/serial/by-id/usb-1a86_USB_Serial-if00-port0"
 BAUD = 38400
 REQ  = "node000300|SensorReq|8985"
+REQ_BYTES = REQ.encode("ascii", errors="ignore")  # encoded once
 
 DB_PATH = "/home/cja/Work/cja-skyfarms-project/data/data.db"
 DB_TABLE = "Dist_2_EC_pH_log"
+DB_PENDING_MAX = 72     # keep at most one day of unsaved slots while the DB is unavailable
 
 SERIAL_LOCK_PATH = "/tmp/usb_1a86_serial.lock"
+SERIAL_LOCK_TIMEOUT_SEC = 5.0   # shared with room_condition.py on the same dongle
 
 # Poll / report / save
 POLL_SEC = 10           # JSON output every 10 sec
@@ -38,11 +47,30 @@ ID_EC   = 30
 
 # Read burst tuning
 TOTAL_TIMEOUT_SEC = 3.0
+FIRST_BYTE_TIMEOUT_SEC = 0.4   # give up early if the node sends nothing at all
 IDLE_GAP_SEC = 0.2
 RETRY_ATTEMPTS = 3
 RETRY_DELAY_SEC = 0.25
 
 
+# ===============================
+# JSON in/out (orjson if installed)
+# ===============================
+if orjson is not None:
+    json_loads = orjson.loads
+
+    def emit(obj):
+        """Write one JSON line to stdout (Node-RED reads line by line)."""
+        sys.stdout.buffer.write(orjson.dumps(obj) + b"\n")
+        sys.stdout.buffer.flush()
+else:
+    json_loads = json.loads
+
+    def emit(obj):
+        """Write one JSON line to stdout (Node-RED reads line by line)."""
+        print(json.dumps(obj, ensure_ascii=False), flush=True)
+
+
 # ===============================
 # Timing (no drift)
 # ===============================
@@ -52,37 +80,94 @@ def sleep_to_next_boundary(step_sec: int):
     next_t = (int(now) // step_sec + 1) * step_sec
     time.sleep(max(0, next_t - now))
 
-def minute_key(dt: datetime.datetime) -> str:
+def minute_key(tm: time.struct_time) -> str:
     """YYYY-MM-DD HH:MM"""
-    return dt.strftime("%Y-%m-%d %H:%M")
+    # Fixed format -> plain f-string (no C strftime / locale path)
+    return f"{tm.tm_year:04d}-{tm.tm_mon:02d}-{tm.tm_mday:02d} {tm.tm_hour:02d}:{tm.tm_min:02d}"
 
 
 # ===============================
 # Serial helpers
 # ===============================
-def read_burst(ser, total_timeout=3.0, idle_gap=0.2) -> bytes:
-    """Read bytes until idle gap after some data (no newline protocol)."""
+# Reused read buffer for read_burst (no per-read bytes allocation)
+_SCRATCH = bytearray(256)
+_SCRATCH_MV = memoryview(_SCRATCH)
+
+def open_serial():
+    """Open PORT without pulsing DTR/RTS (two-step open, no settle sleep)."""
+    ser = serial.Serial()
+    ser.port = PORT
+    ser.baudrate = BAUD
+    ser.bytesize = serial.EIGHTBITS
+    ser.parity = serial.PARITY_NONE
+    ser.stopbits = serial.STOPBITS_ONE
     ser.timeout = 0.1
+    ser.dsrdtr = False
+    ser.rtscts = False
+    ser.dtr = False
+    ser.rts = False
+    ser.open()
+    try:
+        ser.set_low_latency_mode(True)   # ASYNC_LOW_LATENCY (setserial low_latency)
+    except Exception:
+        pass                             # not supported by every USB-serial driver
+    return ser
+
+ser = None  # long-lived port handle (opened once, reopened on error)
+
+def get_serial():
+    """Return the shared port handle, opening it on first use."""
+    global ser
+    if ser is None or not ser.is_open:
+        ser = open_serial()
+    return ser
+
+def reset_serial():
+    """Close current port handle; next get_serial() reopens it."""
+    global ser
+    old = ser
+    ser = None
+    if old is not None:
+        try:
+            old.close()
+        except Exception:
+            pass
+
+def read_burst(ser, total_timeout=3.0, idle_gap=0.2, first_byte_timeout=0.4) -> bytes:
+    """
+    Read bytes until idle gap after some data (no newline protocol).
+    Waits in select() on the port fd, so we wake as soon as bytes arrive
+    and stop right after one idle gap (no 0.1 s read-timeout polling).
+    Returns b"" if no byte arrives within first_byte_timeout.
+    """
+    fd = ser.fileno()
     buf = bytearray()
-    t0 = time.time()
-    last_rx = None
-
-    while time.time() - t0 < total_timeout:
-        chunk = ser.read(256)
-        if chunk:
-            buf += chunk
-            last_rx = time.time()
-        else:
-            if buf and last_rx and (time.time() - last_rx) > idle_gap:
-                break
+    t0_ns = time.monotonic_ns()
+    deadline_ns = t0_ns + int(total_timeout * 1e9)
+    first_deadline_ns = min(deadline_ns, t0_ns + int(first_byte_timeout * 1e9))
+
+    while True:
+        remaining_ns = (deadline_ns if buf else first_deadline_ns) - time.monotonic_ns()
+        if remaining_ns <= 0:
+            break
+        remaining = remaining_ns / 1e9
+        wait = min(idle_gap, remaining) if buf else remaining
+        r, _, _ = select.select([fd], [], [], wait)
+        if r:
+            n = os.readv(fd, [_SCRATCH_MV])
+            if n == 0:
+                raise SerialException("device reports readiness to read but returned no data")
+            buf += _SCRATCH_MV[:n]
+        elif buf:
+            break
     return bytes(buf)
 
+# Control bytes to delete (everything < 0x20 except \t \n \r)
+_CTRL_BYTES = bytes(b for b in range(0x20) if b not in (0x09, 0x0a, 0x0d))
+
 def safe_decode(raw: bytes) -> str:
-    """Decode even if bytes are broken; strip control chars."""
-    raw = raw.replace(b"\x00", b"")
-    text = raw.decode("utf-8", errors="replace")
-    text = re.sub(r"[\x00-\x08\x0b\x0c\x0e-\x1f]", "", text)
-    return text.strip()
+    """Decode even if bytes are broken; strip control chars (one translate pass)."""
+    return raw.translate(None, _CTRL_BYTES).decode("utf-8", errors="replace").strip()
 
 def extract_json_block(text: str):
     """Extract {...} from '|SensorRes|{...}|XXXX'."""
@@ -92,127 +177,184 @@ def extract_json_block(text: str):
         return None
     return text[start:end + 1]
 
+# '"id":16,"value":"6.85"}' (value quoted or bare; must be followed by ',' or '}'
+# so a frame cut inside a number never matches)
+_PAT_IDVAL = re.compile(rb'"id"\s*:\s*(\d+)\s*,\s*"value"\s*:\s*"?\s*([-+0-9.eE]+)\s*"?\s*[,}]')
+_PAT_ID = re.compile(rb'"id"\s*:\s*(\d+)')
+
+def scan_values(raw: bytes):
+    """
+    Fast path: (ec, ph, tp) straight from the raw frame in one regex pass
+    (no decode / json.loads / dicts). None unless all three ids are found,
+    so the caller falls back to the full JSON parse. Only the part up to the
+    last '}' is scanned; frames without one go straight to the full parse.
+    Like get_value_by_id, only the first entry per id counts: if its value
+    doesn't match, later duplicates are ignored and the full parse decides.
+    """
+    end = raw.rfind(b"}")
+    if end == -1:
+        return None
+    found = {}
+    for m in _PAT_ID.finditer(raw, 0, end + 1):
+        sid = int(m.group(1))
+        if sid not in found:
+            mv = _PAT_IDVAL.match(raw, m.start(), end + 1)
+            found[sid] = mv.group(2) if mv else None
+    try:
+        vals = tuple(float(found[i]) for i in (ID_EC, ID_PH, ID_TEMP))
+    except (KeyError, TypeError, ValueError):
+        return None
+    return tuple(x if math.isfinite(x) else None for x in vals)
+
 def get_value_by_id(data: dict, target_id: int):
     """Return float value for sensor id, or None."""
     for s in data.get("sensors", []):
         if s.get("id") == target_id:
-            v = str(s.get("value", "")).strip()
-            try:
+            v = s.get("value")
+            if type(v) in (float, int):  # JSON numbers: no str()/strip() round trip
                 x = float(v)
-                return x if math.isfinite(x) else None
-            except Exception:
+            elif isinstance(v, str) and v.strip():
+                try:
+                    x = float(v)
+                except ValueError:
+                    return None
+            else:
                 return None
+            return x if math.isfinite(x) else None
     return None
 
 
 # ===============================
 # Validity checks
 # ===============================
+# Values are already floats (or None). NaN/inf fail the chained range
+# comparison on their own, so no separate isfinite()/float() per call.
 def is_valid_ec(x) -> bool:
-    return x is not None and math.isfinite(x) and (VALID_EC_MIN <= float(x) <= VALID_EC_MAX)
+    return x is not None and VALID_EC_MIN <= x <= VALID_EC_MAX
 
 def is_valid_ph(x) -> bool:
-    return x is not None and math.isfinite(x) and (VALID_PH_MIN <= float(x) <= VALID_PH_MAX)
+    return x is not None and VALID_PH_MIN <= x <= VALID_PH_MAX
 
 def is_valid_tp(x) -> bool:
-    return x is not None and math.isfinite(x) and (VALID_TP_MIN <= float(x) <= VALID_TP_MAX)
+    return x is not None and VALID_TP_MIN <= x <= VALID_TP_MAX
 
 
 # ===============================
 # SQLite helpers
 # ===============================
+INSERT_SQL = f'INSERT INTO "{DB_TABLE}" ("Date","EC","pH","Solution_Temperature") VALUES (?,?,?,?);'
+
+db = None  # long-lived connection (opened once by ensure_db_schema)
+
 def ensure_db_schema(db_path: str):
-    """Ensure target table/index exist (idempotent)."""
+    """Open the long-lived connection (PRAGMAs once) and ensure table/index exist (idempotent)."""
+    global db
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    conn = sqlite3.connect(db_path, timeout=5.0)
+    # isolation_level=None: autocommit, transactions are explicit in insert_rows()
+    db = sqlite3.connect(db_path, timeout=5.0, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL;")
+    db.execute("PRAGMA synchronous=NORMAL;")
+    db.execute("PRAGMA busy_timeout=5000;")
+    db.execute("PRAGMA temp_store=MEMORY;")
+
+    db.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{DB_TABLE}" (
+            "Date" TEXT,
+            "EC" REAL,
+            "pH" REAL,
+            "Solution_Temperature" REAL
+        );
+    """)
+    db.execute(f'CREATE INDEX IF NOT EXISTS "idx_dist2_ecph_date" ON "{DB_TABLE}"("Date");')
+
+def insert_rows(rows):
+    """Insert queued (date, ec, ph, tp) rows in one transaction (all or nothing)."""
+    db.execute("BEGIN IMMEDIATE;")
     try:
-        conn.execute("PRAGMA journal_mode=WAL;")
-        conn.execute("PRAGMA synchronous=NORMAL;")
-
-        conn.execute(f"""
-            CREATE TABLE IF NOT EXISTS "{DB_TABLE}" (
-                "Date" TEXT,
-                "EC" REAL,
-                "pH" REAL,
-                "Solution_Temperature" REAL
-            );
-        """)
-        conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_dist2_ecph_date" ON "{DB_TABLE}"("Date");')
-        conn.commit()
-    finally:
-        conn.close()
-
-def insert_row(db_path: str, date_str: str, ec, ph, tp):
-    conn = sqlite3.connect(db_path, timeout=5.0)
-    try:
-        conn.execute("PRAGMA journal_mode=WAL;")
-        conn.execute("PRAGMA synchronous=NORMAL;")
-        conn.execute(
-            f'INSERT INTO "{DB_TABLE}" ("Date","EC","pH","Solution_Temperature") VALUES (?,?,?,?);',
-            (date_str, ec, ph, tp)
-        )
-        conn.commit()
-    finally:
-        conn.close()
+        db.executemany(INSERT_SQL, rows)
+        db.execute("COMMIT;")
+    except Exception:
+        try:
+            db.execute("ROLLBACK;")
+        except Exception:
+            pass
+        raise
 
 
 # ===============================
 # Read one request with lock + retry
 # ===============================
-def request_once_with_lock_and_retry():
+def acquire_lock_with_timeout(lockf, timeout_sec: float) -> bool:
+    """Try to acquire filesystem lock within timeout (20 ms backoff, doubling)."""
+    deadline = time.monotonic() + max(0.0, timeout_sec)
+    delay = 0.02
+    while True:
+        try:
+            fcntl.flock(lockf, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.32)
+
+def request_once_with_lock_and_retry(lockf):
     """
+    lockf: SERIAL_LOCK_PATH opened once by main(); only flock'ed here.
     Returns (ec, ph, tp, err_or_none)
     """
-    lockf = open(SERIAL_LOCK_PATH, "w")
     try:
-        fcntl.flock(lockf, fcntl.LOCK_EX)
+        if not acquire_lock_with_timeout(lockf, SERIAL_LOCK_TIMEOUT_SEC):
+            return None, None, None, f"serial_lock_timeout: >{SERIAL_LOCK_TIMEOUT_SEC}s"
 
         last_err = None
 
         for _ in range(RETRY_ATTEMPTS):
             try:
-                with serial.Serial(
-                    PORT, baudrate=BAUD,
-                    bytesize=serial.EIGHTBITS,
-                    parity=serial.PARITY_NONE,
-                    stopbits=serial.STOPBITS_ONE,
-                    timeout=0.1
-                ) as ser:
-                    time.sleep(0.15)
-                    ser.reset_input_buffer()
-                    ser.reset_output_buffer()
-
-                    ser.write(REQ.encode("ascii", errors="ignore"))
-                    ser.flush()
-
-                    raw = read_burst(ser, total_timeout=TOTAL_TIMEOUT_SEC, idle_gap=IDLE_GAP_SEC)
-                    if not raw:
-                        last_err = "no_data"
-                        time.sleep(RETRY_DELAY_SEC)
-                        continue
-
-                    text = safe_decode(raw)
-
-                    json_part = extract_json_block(text)
-                    if not json_part:
-                        last_err = "no_json_block"
-                        time.sleep(RETRY_DELAY_SEC)
-                        continue
-
-                    try:
-                        data = json.loads(json_part)
-                    except Exception as e:
-                        last_err = f"json_load_error: {e}"
-                        time.sleep(RETRY_DELAY_SEC)
-                        continue
-
-                    ph = get_value_by_id(data, ID_PH)
-                    tp = get_value_by_id(data, ID_TEMP)
-                    ec = get_value_by_id(data, ID_EC)
-
+                port = get_serial()
+                port.reset_input_buffer()
+                port.reset_output_buffer()
+
+                port.write(REQ_BYTES)
+                port.flush()
+
+                raw = read_burst(port, total_timeout=TOTAL_TIMEOUT_SEC, idle_gap=IDLE_GAP_SEC,
+                                 first_byte_timeout=FIRST_BYTE_TIMEOUT_SEC)
+                if not raw:
+                    last_err = "no_data"
+                    time.sleep(RETRY_DELAY_SEC)
+                    continue
+
+                vals = scan_values(raw)
+                if vals is not None:
+                    ec, ph, tp = vals
                     return ec, ph, tp, None
 
+                text = safe_decode(raw)
+
+                json_part = extract_json_block(text)
+                if not json_part:
+                    last_err = "no_json_block"
+                    time.sleep(RETRY_DELAY_SEC)
+                    continue
+
+                try:
+                    data = json_loads(json_part)
+                except Exception as e:
+                    last_err = f"json_load_error: {e}"
+                    time.sleep(RETRY_DELAY_SEC)
+                    continue
+
+                ph = get_value_by_id(data, ID_PH)
+                tp = get_value_by_id(data, ID_TEMP)
+                ec = get_value_by_id(data, ID_EC)
+
+                return ec, ph, tp, None
+
             except (SerialException, OSError) as e:
+                # USB/serial glitches often recover after reopening the port.
+                reset_serial()
                 last_err = f"serial_error: {e}"
                 time.sleep(RETRY_DELAY_SEC)
             except Exception as e:
@@ -226,7 +368,6 @@ def request_once_with_lock_and_retry():
             fcntl.flock(lockf, fcntl.LOCK_UN)
         except Exception:
             pass
-        lockf.close()
 
 
 # ===============================
@@ -240,21 +381,36 @@ def main():
     latest_tp = None
     latest_err = None
 
-    last_saved_slot = None  # prevent duplicate insert per boundary slot
+    last_saved_bucket = None  # epoch // (DB_EVERY_MIN*60) of last queued slot (one per slot)
+    pending_rows = []         # slots not yet committed (retried with the next slot on DB errors)
+
+    # Shared with room_condition.py: open once, lock only around each request.
+    # "a": no truncate (no metadata write per sample)
+    lockf = open(SERIAL_LOCK_PATH, "a")
 
     # Optional: started message (still one-line JSON)
-    print(json.dumps({
+    emit({
         "type": "started",
         "db": DB_PATH,
         "table": DB_TABLE,
         "poll_sec": POLL_SEC,
         "db_every_min": DB_EVERY_MIN
-    }, ensure_ascii=False), flush=True)
+    })
+
+    # Align to the wall-clock boundary once, then tick on a monotonic
+    # deadline (immune to NTP steps, no per-tick boundary recomputation)
+    sleep_to_next_boundary(POLL_SEC)
+    next_tick = time.monotonic()
 
     while True:
-        sleep_to_next_boundary(POLL_SEC)
+        delay = next_tick - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -POLL_SEC:
+            next_tick = time.monotonic()  # overran: skip missed ticks instead of bursting
+        next_tick += POLL_SEC
 
-        ec, ph, tp, err = request_once_with_lock_and_retry()
+        ec, ph, tp, err = request_once_with_lock_and_retry(lockf)
 
         if err is None:
             if is_valid_ec(ec):
@@ -268,8 +424,9 @@ def main():
         else:
             latest_err = err
 
-        now = datetime.datetime.now()
-        mkey = minute_key(now)
+        now_ts = time.time()
+        tm = time.localtime(now_ts)
+        mkey = minute_key(tm)
 
         # Base output (ALWAYS one line JSON)
         out = {
@@ -291,26 +448,32 @@ def main():
         }
 
         # DB save at boundary minute (00/15/30/45) once per slot
-        if now.minute % DB_EVERY_MIN == 0:
+        if tm.tm_min % DB_EVERY_MIN == 0:
             out["save"]["should"] = True
 
-            slot_min = (now.minute // DB_EVERY_MIN) * DB_EVERY_MIN
-            slot_dt = now.replace(minute=slot_min, second=0, microsecond=0)
-            slot_key = slot_dt.strftime("%Y-%m-%d %H:%M")
+            # On a boundary minute the slot key is the minute key itself
+            slot_key = mkey
             out["save"]["slot"] = slot_key
 
-            if last_saved_slot != slot_key:
+            bucket = int(now_ts) // (DB_EVERY_MIN * 60)
+            if last_saved_bucket != bucket:
                 if latest_ec is None or latest_ph is None or latest_tp is None:
                     out["errors"]["db"] = "skip_save: latest values are None"
                 else:
-                    try:
-                        insert_row(DB_PATH, slot_key, latest_ec, latest_ph, latest_tp)
-                        last_saved_slot = slot_key
-                        out["save"]["did"] = True
-                    except Exception as e:
-                        out["errors"]["db"] = f"db_write_failed: {e}"
-
-        print(json.dumps(out, ensure_ascii=False), flush=True)
+                    pending_rows.append((slot_key, latest_ec, latest_ph, latest_tp))
+                    del pending_rows[:-DB_PENDING_MAX]
+                    last_saved_bucket = bucket
+
+            # Flush queued slots in one transaction (retried every tick of the boundary minute)
+            if pending_rows:
+                try:
+                    insert_rows(pending_rows)
+                    pending_rows.clear()
+                    out["save"]["did"] = True
+                except Exception as e:
+                    out["errors"]["db"] = f"db_write_failed: {e} (pending={len(pending_rows)})"
+
+        emit(out)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Shared serial helpers for the '|SensorReq|' / '|SensorRes|{...}|' nodes
+(room_condition.py, test_code/temp_gawha.py, test_code/room_condition_twoway.py).
+"""
+import os
+import time
+import select
+from serial.serialutil import SerialException
+
+MAX_FRAME_BYTES = 8192  # a SensorRes frame is ~100 B; stop reading runaway/garbage streams
+
+
+def read_frame(ser, timeout=2.5, idle_gap=0.2) -> bytes:
+    """
+    Read until no more bytes arrive for a short idle gap (no newline protocol).
+    poll() on the port fd wakes as soon as bytes arrive and ends one idle gap
+    after the last byte (no read-timeout spinning / wall-clock checks).
+    """
+    fd = ser.fileno()
+    poller = select.poll()
+    poller.register(fd, select.POLLIN)
+    chunks = []
+    total = 0
+    deadline_ns = time.monotonic_ns() + int(timeout * 1e9)
+    idle_ms = int(idle_gap * 1000)
+
+    while True:
+        remaining_ms = (deadline_ns - time.monotonic_ns()) // 1_000_000
+        if remaining_ms <= 0:
+            break
+        if poller.poll(min(idle_ms, remaining_ms) if total else remaining_ms):
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                raise SerialException("device reports readiness to read but returned no data")
+            chunks.append(chunk)
+            total += len(chunk)
+            if total >= MAX_FRAME_BYTES:
+                break
+        elif total:
+            break   # idle gap after data
+
+    return b"".join(chunks)
+
+
+def extract_json_block(raw: bytes):
+    """Extract {...} part from b'|SensorRes|{...}|XXXX' (bytes in, bytes out; no decode)."""
+    if b"\x00" in raw:
+        raw = raw.replace(b"\x00", b"")
+    start = raw.find(b"{")
+    end = raw.rfind(b"}")
+    if start == -1 or end == -1 or end <= start:
+        return None
+    return raw[start:end + 1]
@@ -1,23 +1,37 @@
 # -*- coding: utf-8 -*-
 import os
+import sys
+import atexit
+import signal
 import json
 import time
-import datetime
+import math
 import serial
 import fcntl
 import sqlite3
 from serial.serialutil import SerialException
 
+from _serial_io import read_frame, extract_json_block
+
+try:
+    import orjson  # optional, faster JSON encode/decode
+except ImportError:
+    orjson = None
+
 # ===============================
 # Settings
 # ===============================
 PORT = "/dev/serial/by-id/usb-1a86_USB_Serial-if00-port0"
 BAUD = 38400
 REQ  = "node000000|SensorReq|0905"
+REQ_BYTES = REQ.encode("ascii", errors="ignore")  # encoded once
 
 # SQLite
 DB_PATH = "/home/cja/Work/cja-skyfarms-project/data/data.db"
 DB_TABLE = "Temp_humi_log"
+# Opt-in: ROOM_CONDITION_DB_SYNC_OFF=1 -> PRAGMA synchronous=OFF (no fsync on commit;
+# a power cut can lose the last rows). Default stays WAL + NORMAL.
+DB_SYNCHRONOUS = "OFF" if os.environ.get("ROOM_CONDITION_DB_SYNC_OFF") == "1" else "NORMAL"
 
 # Sensor IDs
 ID_TEMPERATURE = 1
@@ -26,10 +40,12 @@ ID_CO2         = 6
 
 # Lock (prevent concurrent access to same USB serial)
 SERIAL_LOCK_PATH = "/tmp/usb_1a86_serial.lock"
+SERIAL_LOCK_TIMEOUT_SEC = 5.0   # shared with Dist_2_EC_pH.py on the same dongle
 
 # Timings
 PRINT_EVERY_SEC = 10      # JSON output every 10 sec
 SAVE_EVERY_MIN  = 20      # DB save every 20 min (00/20/40) - robust slot based
+DB_PENDING_MAX  = 72      # keep at most one day of unsaved slots while the DB is unavailable
 
 # Read burst tuning
 READ_TIMEOUT_SEC = 2.5
@@ -38,6 +54,24 @@ RETRY_ATTEMPTS = 3
 RETRY_DELAY_SEC = 0.25
 
 
+# ===============================
+# JSON in/out (orjson if installed)
+# ===============================
+if orjson is not None:
+    json_loads = orjson.loads
+
+    def emit(obj):
+        """Write one JSON line to stdout (Node-RED reads line by line)."""
+        sys.stdout.buffer.write(orjson.dumps(obj) + b"\n")
+        sys.stdout.buffer.flush()
+else:
+    json_loads = json.loads
+
+    def emit(obj):
+        """Write one JSON line to stdout (Node-RED reads line by line)."""
+        print(json.dumps(obj, ensure_ascii=False), flush=True)
+
+
 # ===============================
 # Timing (no drift)
 # ===============================
@@ -48,88 +82,116 @@ def sleep_to_next_boundary(step_sec: int):
     time.sleep(max(0, next_t - now))
 
 
-def minute_key(dt: datetime.datetime) -> str:
+def minute_key(tm: time.struct_time) -> str:
     """YYYY-MM-DD HH:MM"""
-    return dt.strftime("%Y-%m-%d %H:%M")
+    # Fixed format -> plain f-string (no C strftime / locale path)
+    return f"{tm.tm_year:04d}-{tm.tm_mon:02d}-{tm.tm_mday:02d} {tm.tm_hour:02d}:{tm.tm_min:02d}"
 
 
-def slot_key_for(dt: datetime.datetime, step_min: int) -> str:
+def slot_key_for(tm: time.struct_time, step_min: int) -> str:
     """
     Return slot key "YYYY-MM-DD HH:MM" floored to step minutes.
     Example: 13:20:55 with step=20 -> 13:20
     """
-    slot_min = (dt.minute // step_min) * step_min
-    slot_dt = dt.replace(minute=slot_min, second=0, microsecond=0)
-    return slot_dt.strftime("%Y-%m-%d %H:%M")
+    slot_min = (tm.tm_min // step_min) * step_min
+    return f"{tm.tm_year:04d}-{tm.tm_mon:02d}-{tm.tm_mday:02d} {tm.tm_hour:02d}:{slot_min:02d}"
 
 
 # ===============================
 # Serial helpers
 # ===============================
-def read_one_response(ser, timeout=2.5, idle_gap=0.2) -> bytes:
-    """Read until no more bytes arrive for a short idle gap (no newline protocol)."""
-    ser.timeout = idle_gap
-    buf = bytearray()
-    t0 = time.time()
-    last_rx = None
-
-    while time.time() - t0 < timeout:
-        chunk = ser.read(256)
-        if chunk:
-            buf += chunk
-            last_rx = time.time()
-        else:
-            if buf and last_rx and (time.time() - last_rx) > idle_gap:
-                break
+ser = None  # long-lived port handle (opened once, reopened on error)
 
-    return bytes(buf)
 
-
-def extract_json_block(text: str):
-    """Extract {...} part from '|SensorRes|{...}|XXXX'."""
-    start = text.find("{")
-    end = text.rfind("}")
-    if start == -1 or end == -1 or end <= start:
-        return None
-    return text[start:end + 1]
+def set_low_latency(port):
+    """
+    Best effort: shorten the USB-serial receive latency.
+    - latency_timer=1 ms in sysfs (FTDI-style drivers; needs write permission)
+    - ASYNC_LOW_LATENCY via TIOCSSERIAL (setserial low_latency)
+    Drivers without either knob are left as they are.
+    """
+    tty = os.path.basename(os.path.realpath(PORT))
+    try:
+        with open(f"/sys/bus/usb-serial/devices/{tty}/latency_timer", "w") as f:
+            f.write("1")
+    except OSError:
+        pass
+    try:
+        port.set_low_latency_mode(True)
+    except Exception:
+        pass
+
+
+def get_serial():
+    """Return the shared port handle, opening it on first use."""
+    global ser
+    if ser is None or not ser.is_open:
+        ser = serial.Serial(PORT, BAUD, bytesize=8, parity="N", stopbits=1, timeout=0.2)
+        set_low_latency(ser)
+    return ser
+
+
+def reset_serial():
+    """Close current port handle; next get_serial() reopens it."""
+    global ser
+    old = ser
+    ser = None
+    if old is not None:
+        try:
+            old.close()
+        except Exception:
+            pass
 
 
-def get_value_by_id(data: dict, target_id: int):
-    """Return float value for sensor id, or None."""
+def values_by_id(data: dict) -> dict:
+    """Map sensor id -> raw value in one pass (first entry per id wins)."""
+    vals = {}
     for s in data.get("sensors", []):
-        if s.get("id") == target_id:
-            v = str(s.get("value", "")).strip()
-            try:
-                return float(v)
-            except Exception:
-                return None
-    return None
+        vals.setdefault(s.get("id"), s.get("value", ""))
+    return vals
+
 
+def to_float(v):
+    """Return finite float for a raw sensor value (number or string), or None."""
+    try:
+        if type(v) in (float, int):  # JSON numbers: no str()/strip() round trip
+            x = float(v)
+        elif isinstance(v, str) and v.strip():
+            x = float(v)
+        else:
+            return None
+    except (ValueError, OverflowError):
+        return None
+    return x if math.isfinite(x) else None
 
-def read_sensor_once():
-    """Single attempt: open port, send request, read response, parse values."""
-    with serial.Serial(PORT, BAUD, bytesize=8, parity="N", stopbits=1, timeout=0.2) as ser:
-        ser.reset_input_buffer()
-        ser.reset_output_buffer()
 
-        ser.write(REQ.encode("ascii", errors="ignore"))
-        ser.flush()
+def read_sensor_once(port):
+    """Single attempt on the already-open port: send request, read response, parse values."""
+    port.reset_input_buffer()
+    port.reset_output_buffer()
 
-        raw = read_one_response(ser, timeout=READ_TIMEOUT_SEC, idle_gap=IDLE_GAP_SEC)
+    port.write(REQ_BYTES)
+    port.flush()
 
-    text = raw.replace(b"\x00", b"").decode("utf-8", errors="replace").strip()
-    json_part = extract_json_block(text)
+    raw = read_frame(port, timeout=READ_TIMEOUT_SEC, idle_gap=IDLE_GAP_SEC)
+
+    json_part = extract_json_block(raw)
     if not json_part:
         return None, None, None, "no_json_block"
 
     try:
-        data = json.loads(json_part)
-    except Exception as e:
-        return None, None, None, f"json_load_error: {e}"
+        data = json_loads(json_part)   # bytes straight in (json/orjson both accept bytes)
+    except Exception:
+        # Broken UTF-8 in the frame: retry on the lossy-decoded text like before
+        try:
+            data = json_loads(json_part.decode("utf-8", errors="replace"))
+        except Exception as e:
+            return None, None, None, f"json_load_error: {e}"
 
-    temperature = get_value_by_id(data, ID_TEMPERATURE)
-    humidity = get_value_by_id(data, ID_HUMIDITY)
-    co2 = get_value_by_id(data, ID_CO2)
+    vals = values_by_id(data)
+    temperature = to_float(vals.get(ID_TEMPERATURE))
+    humidity = to_float(vals.get(ID_HUMIDITY))
+    co2 = to_float(vals.get(ID_CO2))
 
     # Accept only when ALL exist (stickiness handled in main)
     if temperature is None or humidity is None or co2 is None:
@@ -138,23 +200,45 @@ def read_sensor_once():
     return temperature, humidity, co2, None
 
 
-def read_sensor_with_lock_and_retry():
-    """Prevent concurrent access + retry a few times for stability."""
-    lockf = open(SERIAL_LOCK_PATH, "w")
+def acquire_lock_with_timeout(lockf, timeout_sec: float) -> bool:
+    """Try to acquire filesystem lock within timeout (20 ms backoff, doubling)."""
+    deadline = time.monotonic() + max(0.0, timeout_sec)
+    delay = 0.02
+    while True:
+        try:
+            fcntl.flock(lockf, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.32)
+
+
+def read_sensor_with_lock_and_retry(lockf):
+    """
+    Prevent concurrent access + retry a few times for stability.
+    lockf: SERIAL_LOCK_PATH opened once by main(); only flock'ed here.
+    """
     try:
-        fcntl.flock(lockf, fcntl.LOCK_EX)
+        if not acquire_lock_with_timeout(lockf, SERIAL_LOCK_TIMEOUT_SEC):
+            return None, None, None, f"serial_lock_timeout: >{SERIAL_LOCK_TIMEOUT_SEC}s"
 
         last_err = None
         last_vals = (None, None, None)
 
         for _ in range(RETRY_ATTEMPTS):
             try:
-                t, h, c, err = read_sensor_once()
+                t, h, c, err = read_sensor_once(get_serial())
                 last_vals = (t, h, c)
                 last_err = err
-                if err is None:
-                    return t, h, c, None
+                # value_missing is a complete reply with null values; re-reading won't help.
+                if err in (None, "value_missing"):
+                    return t, h, c, err
             except (SerialException, OSError) as e:
+                # USB/serial glitches often recover after reopening the port.
+                reset_serial()
                 last_err = f"serial_error: {e}"
             except Exception as e:
                 last_err = f"unknown_error: {e}"
@@ -168,48 +252,55 @@ def read_sensor_with_lock_and_retry():
             fcntl.flock(lockf, fcntl.LOCK_UN)
         except Exception:
             pass
-        lockf.close()
 
 
 # ===============================
 # SQLite helpers
 # ===============================
-def ensure_db_schema(db_path: str, table: str):
-    """Create table/index if not exists. Keep schema with CAPITAL column names."""
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    conn = sqlite3.connect(db_path, timeout=5.0)
-    try:
-        conn.execute("PRAGMA journal_mode=WAL;")
-        conn.execute("PRAGMA synchronous=NORMAL;")
-
-        # Match your actual schema: Date/Temperature/Humidity/CO2
-        conn.execute(f"""
-            CREATE TABLE IF NOT EXISTS "{table}" (
-                "Date" TEXT,
-                "Temperature" REAL,
-                "Humidity" REAL,
-                "CO2" INTEGER
-            );
-        """)
-        conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{table}_date" ON "{table}"("Date");')
-        conn.commit()
-    finally:
-        conn.close()
+db = None  # long-lived connection (opened once by ensure_db_schema)
 
 
-def insert_room_condition(db_path: str, table: str, date_str: str, temperature, humidity, co2):
-    """Insert one row (Date/Temperature/Humidity/CO2)."""
-    conn = sqlite3.connect(db_path, timeout=5.0)
+def ensure_db_schema(db_path: str, table: str):
+    """
+    Open the long-lived connection (PRAGMAs once) and create table/index if not exists.
+    Keep schema with CAPITAL column names.
+    """
+    global db
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    # isolation_level=None: autocommit, transactions are explicit in insert_room_condition()
+    db = sqlite3.connect(db_path, timeout=5.0, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL;")
+    db.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS};")
+    db.execute("PRAGMA busy_timeout=5000;")
+    db.execute("PRAGMA temp_store=MEMORY;")
+
+    # Match your actual schema: Date/Temperature/Humidity/CO2
+    db.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{table}" (
+            "Date" TEXT,
+            "Temperature" REAL,
+            "Humidity" REAL,
+            "CO2" INTEGER
+        );
+    """)
+    db.execute(f'CREATE INDEX IF NOT EXISTS "idx_{table}_date" ON "{table}"("Date");')
+
+
+def insert_rows(table: str, rows):
+    """Insert queued (Date, Temperature, Humidity, CO2) rows in one transaction (all or nothing)."""
+    db.execute("BEGIN IMMEDIATE;")
     try:
-        conn.execute("PRAGMA journal_mode=WAL;")
-        conn.execute("PRAGMA synchronous=NORMAL;")
-        conn.execute(
+        db.executemany(
             f'INSERT INTO "{table}" ("Date","Temperature","Humidity","CO2") VALUES (?,?,?,?);',
-            (date_str, temperature, humidity, int(co2) if co2 is not None else None)
+            rows
         )
-        conn.commit()
-    finally:
-        conn.close()
+        db.execute("COMMIT;")
+    except Exception:
+        try:
+            db.execute("ROLLBACK;")
+        except Exception:
+            pass
+        raise
 
 
 # ===============================
@@ -218,6 +309,14 @@ def insert_room_condition(db_path: str, table: str, date_str: str, temperature,
 def main():
     ensure_db_schema(DB_PATH, DB_TABLE)
 
+    # Port stays open for the whole run; close it on exit/SIGTERM
+    atexit.register(reset_serial)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    # Shared with Dist_2_EC_pH.py: open once, lock only around each poll.
+    # "a": no truncate (no metadata write per poll)
+    lockf = open(SERIAL_LOCK_PATH, "a")
+
     # Stickiness (last good values)
     latest_t = None
     latest_h = None
@@ -225,13 +324,14 @@ def main():
     latest_err = None
 
     # Save guard (prevent duplicate save within the same slot)
-    last_saved_slot = None
+    last_saved_bucket = None  # epoch // (SAVE_EVERY_MIN*60) of last queued slot
+    pending_rows = []         # slots not yet committed (retried with the next slot on DB errors)
 
     while True:
         # 1) Run on exact 10-second boundaries
         sleep_to_next_boundary(PRINT_EVERY_SEC)
 
-        t, h, c, err = read_sensor_with_lock_and_retry()
+        t, h, c, err = read_sensor_with_lock_and_retry(lockf)
 
         # Update latest only when sample is complete and valid
         if err is None and t is not None and h is not None and c is not None:
@@ -240,8 +340,9 @@ def main():
         else:
             latest_err = err
 
-        now = datetime.datetime.now()
-        mkey = minute_key(now)
+        now_ts = time.time()
+        tm = time.localtime(now_ts)
+        mkey = minute_key(tm)
 
         # Prepare output (single-line JSON only)
         out = {
@@ -263,22 +364,29 @@ def main():
         # 2) Robust slot-based save (independent of second timing)
         #    Save ONCE per slot, but only when we're inside a boundary minute.
         #    Example: any time during 13:20:xx counts as the "13:20" slot.
-        if now.minute % SAVE_EVERY_MIN == 0:
-            skey = slot_key_for(now, SAVE_EVERY_MIN)
+        if tm.tm_min % SAVE_EVERY_MIN == 0:
+            skey = slot_key_for(tm, SAVE_EVERY_MIN)
             out["save"]["slot"] = skey
 
-            if last_saved_slot != skey:
+            bucket = int(now_ts) // (SAVE_EVERY_MIN * 60)
+            if last_saved_bucket != bucket:
                 if latest_t is None or latest_h is None or latest_c is None:
                     out["errors"]["db"] = "skip_save: latest values are None"
                 else:
-                    try:
-                        insert_room_condition(DB_PATH, DB_TABLE, skey, latest_t, latest_h, latest_c)
-                        last_saved_slot = skey
-                        out["save"]["did"] = True
-                    except Exception as e:
-                        out["errors"]["db"] = f"db_write_failed: {e}"
-
-        print(json.dumps(out, ensure_ascii=False), flush=True)
+                    pending_rows.append((skey, latest_t, latest_h, int(latest_c)))
+                    del pending_rows[:-DB_PENDING_MAX]
+                    last_saved_bucket = bucket
+
+            # Flush queued slots in one transaction (retried every tick of the boundary minute)
+            if pending_rows:
+                try:
+                    insert_rows(DB_TABLE, pending_rows)
+                    pending_rows.clear()
+                    out["save"]["did"] = True
+                except Exception as e:
+                    out["errors"]["db"] = f"db_write_failed: {e} (pending={len(pending_rows)})"
+
+        emit(out)
 
 
 if __name__ == "__main__":
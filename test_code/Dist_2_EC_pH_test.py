@@ -12,16 +12,17 @@ def read_one_response(ser, timeout=1.5, idle_gap=0.2):
     """Read until no more bytes arrive for a short idle gap (no newline protocol)."""
     ser.timeout = idle_gap
     buf = bytearray()
-    t0 = time.time()
-    last_rx = time.time()
+    timeout_ns = int(timeout * 1e9)
+    idle_gap_ns = int(idle_gap * 1e9)
+    t0 = last_rx = time.monotonic_ns()
 
-    while time.time() - t0 < timeout:
+    while time.monotonic_ns() - t0 < timeout_ns:
         chunk = ser.read(256)
         if chunk:
             buf += chunk
-            last_rx = time.time()
+            last_rx = time.monotonic_ns()
         else:
-            if buf and (time.time() - last_rx) > idle_gap:
+            if buf and (time.monotonic_ns() - last_rx) > idle_gap_ns:
                 break
     return bytes(buf)
 
@@ -1,8 +1,8 @@
 
 # -*- coding: utf-8 -*-
 import os
+import sys
 import json
-import time
 import csv
 import datetime
 import serial
@@ -10,6 +10,15 @@ import minimalmodbus
 import fcntl
 import pause
 
+# Shared serial helpers live in ../sensors
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sensors"))
+from _serial_io import read_frame, extract_json_block
+
+try:
+    import orjson  # optional, faster JSON encode/decode
+except ImportError:
+    orjson = None
+
 # ===============================
 # Global lock (optional)
 # ===============================
@@ -33,6 +42,25 @@ TEMP_HUMI_FC = 4             # input registers
 CO2_PORT = "/dev/serial/by-id/usb-1a86_USB_Serial-if00-port0"
 CO2_BAUD = 115200
 CO2_REQ  = "node000000|SensorReq|0905"
+CO2_REQ_BYTES = CO2_REQ.encode("ascii")  # encoded once
+
+# ===============================
+# JSON in/out (orjson if installed)
+# ===============================
+if orjson is not None:
+    json_loads = orjson.loads
+
+    def emit(obj):
+        """Write one JSON line to stdout (Node-RED reads line by line)."""
+        sys.stdout.buffer.write(orjson.dumps(obj) + b"\n")
+        sys.stdout.buffer.flush()
+else:
+    json_loads = json.loads
+
+    def emit(obj):
+        """Write one JSON line to stdout (Node-RED reads line by line)."""
+        print(json.dumps(obj, ensure_ascii=False), flush=True)
+
 
 # ===============================
 # Temp/Humi functions
@@ -54,51 +82,35 @@ def read_temp_humi():
 # ===============================
 # CO2 functions
 # ===============================
-def read_one_response(ser, timeout=1.5):
-    """Read until no more bytes arrive for a short idle gap (no newline protocol)."""
-    ser.timeout = 0.2
-    buf = bytearray()
-    t0 = time.time()
-    last_rx = time.time()
-
-    while time.time() - t0 < timeout:
-        chunk = ser.read(256)
-        if chunk:
-            buf += chunk
-            last_rx = time.time()
-        else:
-            if buf and (time.time() - last_rx) > 0.2:
-                break
-    return bytes(buf)
-
-def extract_json_block(text: str):
-    """Extract {...} part from '|SensorRes|{...}|XXXX'."""
-    start = text.find("{")
-    end = text.rfind("}")
-    if start == -1 or end == -1 or end <= start:
-        return None
-    return text[start:end + 1]
-
-def parse_co2_value(text: str):
+def parse_co2_value(raw: bytes):
     """Return CO2 value (id=6) as int if possible, else None."""
-    json_part = extract_json_block(text)
+    json_part = extract_json_block(raw)
     if not json_part:
         return None
 
     try:
-        data = json.loads(json_part)
-    except:
-        return None
+        data = json_loads(json_part)
+    except Exception:
+        # Broken UTF-8 in the frame: retry on the lossy-decoded text like before
+        try:
+            data = json_loads(json_part.decode("utf-8", errors="ignore"))
+        except Exception:
+            return None
 
     for s in data.get("sensors", []):
         if s.get("id") == 6:
-            v = str(s.get("value", "")).strip()
+            v = s.get("value")
+            if type(v) in (int, float):  # JSON numbers: no str()/strip() round trip
+                return v
+            if not isinstance(v, str):
+                return None
+            v = v.strip()
             try:
                 return int(v)
-            except:
+            except ValueError:
                 try:
                     return float(v)
-                except:
+                except ValueError:
                     return None
     return None
 
@@ -107,13 +119,12 @@ def read_co2():
         ser.reset_input_buffer()
         ser.reset_output_buffer()
 
-        ser.write(CO2_REQ.encode("ascii"))
+        ser.write(CO2_REQ_BYTES)
         ser.flush()
 
-        raw = read_one_response(ser, timeout=2.0)
+        raw = read_frame(ser, timeout=2.0)
 
-    text = raw.replace(b"\x00", b"").decode("utf-8", errors="ignore").strip()
-    return parse_co2_value(text)
+    return parse_co2_value(raw)
 
 # ===============================
 # CSV logging
@@ -164,4 +175,4 @@ if __name__ == "__main__":
         "humidity": humidity,
         "co2": co2
     }
-    print(json.dumps(out, ensure_ascii=False), flush=True)
\ No newline at end of file
+    emit(out)
\ No newline at end of file
@@ -1,30 +1,19 @@
 # -*- coding: utf-8 -*-
+import os
+import sys
 import json
-import time
 import serial
 
+# Shared serial helpers live in ../sensors
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sensors"))
+from _serial_io import read_frame
+
 PORT = "/dev/serial/by-path/platform-xhci-hcd.1-usb-0:1.2:1.0-port0"
 PORT = "/dev//serial/by-id/usb-1a86_USB_Serial-if00-port0"
 # BAUD = 115200
 BAUD = 38400
 REQ  = "node000000|SensorReq|0905"
-
-def read_one_response(ser, timeout=1.5, idle_gap=0.2):
-    """Read until no more bytes arrive for a short idle gap (no newline protocol)."""
-    ser.timeout = idle_gap
-    buf = bytearray()
-    t0 = time.time()
-    last_rx = time.time()
-
-    while time.time() - t0 < timeout:
-        chunk = ser.read(256)
-        if chunk:
-            buf += chunk
-            last_rx = time.time()
-        else:
-            if buf and (time.time() - last_rx) > idle_gap:
-                break
-    return bytes(buf)
+REQ_BYTES = REQ.encode("ascii", errors="ignore")  # encoded once
 
 if __name__ == "__main__":
     try:
@@ -32,10 +21,10 @@ if __name__ == "__main__":
             ser.reset_input_buffer()
             ser.reset_output_buffer()
 
-            ser.write(REQ.encode("ascii", errors="ignore"))
+            ser.write(REQ_BYTES)
             ser.flush()
 
-            raw = read_one_response(ser, timeout=2.5, idle_gap=0.2)
+            raw = read_frame(ser, timeout=2.5, idle_gap=0.2)
 
         # Show everything without parsing
         text = raw.replace(b"\x00", b"").decode("utf-8", errors="replace").strip()
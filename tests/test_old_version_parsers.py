@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Parser regression tests for the old_version/ Dist_2 scripts.
+Run from the repo root: python -m unittest discover -s tests
+(needs pyserial installed, like the scripts themselves).
+"""
+import os
+import random
+import unittest
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import serial  # noqa: F401  (the scripts import it at module level)
+except ImportError:
+    serial = None
+
+
+def load_script(relpath: str, name: str):
+    """Import a standalone script by path (old_version/ is not a package)."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, relpath))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def frame(ph: str, tp: str, ec: str) -> bytes:
+    return (
+        b'|SensorRes|{"sensors":['
+        b'{"id":16,"value":"' + ph + b'"},'
+        b'{"id":29,"value":"' + tp + b'"},'
+        b'{"id":30,"value":"' + ec + b'"}]}|A1B2'
+    )
+
+
+@unittest.skipIf(serial is None, "pyserial not installed")
+class HampelParseTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.mod = load_script(
+            "old_version/Dist_2_EC_pH_with_hampel_filter_and_check_confirmation.py",
+            "dist2_hampel",
+        )
+
+    def test_clean_frame(self):
+        self.assertEqual(self.mod.parse_ec_ph_tp(frame(b"6.85", b"23.1", b"1.52")), (1.52, 6.85, 23.1))
+
+    def test_control_byte_inside_value(self):
+        raw = frame(b"6\x01.85", b"23.1", b"1.52")
+        self.assertEqual(self.mod.parse_ec_ph_tp(raw), (1.52, 6.85, 23.1))
+
+    def test_control_byte_inside_key(self):
+        raw = frame(b"6.85", b"23.1", b"1.52").replace(b'"value"', b'"va\x02lue"', 1)
+        self.assertEqual(self.mod.parse_ec_ph_tp(raw), (1.52, 6.85, 23.1))
+
+
+@unittest.skipIf(serial is None, "pyserial not installed")
+class FastPathMatchesRegexTest(unittest.TestCase):
+    """parse_values_fast may bail out, but must never disagree with _PAT_IDVAL."""
+
+    CLEAN = frame(b"6.85", b"23.1", b"1.52")
+
+    @classmethod
+    def setUpClass(cls):
+        cls.mod = load_script("old_version/Dist_2_EC_pH_20260105.py", "dist2_20260105")
+
+    def regex_values(self, text: str):
+        found = {}
+        for m in self.mod._PAT_IDVAL.finditer(text):
+            try:
+                found[int(m.group(1))] = float(m.group(2))
+            except ValueError:
+                pass
+        return found.get(self.mod.ID_EC), found.get(self.mod.ID_PH), found.get(self.mod.ID_TEMP)
+
+    def assert_consistent(self, text: str):
+        fast = self.mod.parse_values_fast(text)
+        if fast != (None, None, None):
+            self.assertEqual(fast, self.regex_values(text), repr(text))
+
+    def test_clean_frame(self):
+        text = self.mod.safe_decode(self.CLEAN)
+        self.assertEqual(self.mod.parse_values_fast(text), (1.52, 6.85, 23.1))
+
+    def test_digit_between_id_and_value(self):
+        for text in ('{"id":16,0"value":"66.85"}', '{"id":30,1"value":"1.2"}'):
+            self.assertEqual(self.mod.parse_values_fast(text), (None, None, None))
+            self.assertEqual(self.mod.parse_values_very_robust(text), self.regex_values(text))
+
+    def test_corrupted_frames(self):
+        rng = random.Random(1)
+        alphabet = b'0123456789{}":,.IDVvalueid\x01\xff/ '
+        for _ in range(20000):
+            b = bytearray(self.CLEAN)
+            for _ in range(rng.randint(1, 4)):
+                op, i = rng.randrange(3), rng.randrange(len(b))
+                if op == 0:
+                    b[i] = rng.choice(alphabet)
+                elif op == 1:
+                    b.insert(i, rng.choice(alphabet))
+                else:
+                    del b[i]
+            self.assert_consistent(self.mod.safe_decode(bytes(b)))
+
+
+if __name__ == "__main__":
+    unittest.main()